@@ -1,26 +1,84 @@
 """Rollease Acmeda Automate Pulse asyncio protocol implementation."""
 
+import importlib
 import logging
+from typing import TYPE_CHECKING, Any
 
-from .const import MovingAction, UpdateType
+from .const import (
+    Backpressure,
+    CommandStatus,
+    HealthStatus,
+    MovingAction,
+    Transport,
+    UpdateType,
+)
 from .devices import Hub, Roller
 from .errors import (
     CannotConnectException,
     InvalidResponseException,
     NotConnectedException,
     NotRunningException,
+    QueueFullException,
 )
+from .group import HubGroup
+from .journal import StateJournal
+from .scenes import SceneRegistry
+from .snapshot import HubSnapshot
+from .tracing import FrameTrace, Tracer
+from .tracking import TrackedCommand
+
+if TYPE_CHECKING:
+    from .discovery import probe_hubs, scan_subnet
+    from .sharding import ShardedHubs
+    from .sync import SyncClient
 
 __all__ = [
     "Hub",
     "Roller",
+    "HubGroup",
+    "ShardedHubs",
+    "HubSnapshot",
+    "StateJournal",
+    "SceneRegistry",
+    "SyncClient",
+    "TrackedCommand",
+    "Tracer",
+    "FrameTrace",
     "CannotConnectException",
     "NotConnectedException",
     "NotRunningException",
     "InvalidResponseException",
+    "QueueFullException",
     "UpdateType",
     "MovingAction",
+    "Transport",
+    "HealthStatus",
+    "Backpressure",
+    "CommandStatus",
+    "probe_hubs",
+    "scan_subnet",
 ]
 __version__ = "1.0.0"
 
 _LOGGER = logging.getLogger(__name__)
+
+# Imported on first use, so short lived tools don't pay for the modules these need
+# (multiprocessing, threading, ipaddress)
+_LAZY_IMPORTS = {
+    "ShardedHubs": ".sharding",
+    "SyncClient": ".sync",
+    "probe_hubs": ".discovery",
+    "scan_subnet": ".discovery",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_IMPORTS:
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
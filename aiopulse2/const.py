@@ -30,16 +30,23 @@ DEVICE_MOVE_TO_POSITION_RESPONSE = re.compile(
     r"!(?P<id>\w{3})m(?P<closedpercent>\d{3}),R(?P<signal>[0-9A-F]{2});"
 )
 
+# The hub replies to a stop with the current position (DEVICE_QUERY_POSITION_RESPONSE)
+DEVICE_STOP = "!{id:3}s;"
+
 WS_ROLLER_VOLTAGE = re.compile(
     r"(?P<voltage>[\.0-9]+)(?P<type>[A-Za-z])(?P<version>\d{2})"
 )
 
-ALL_RESPONSES = {}
-# This build the ALL_RESPONSES dict by looking at the globals in the context
-# of the module. More work at start, but less chance of human error
-for var, value in dict(globals()).items():
-    if var.endswith("_RESPONSE"):
-        ALL_RESPONSES[var] = value
+# All of the *_RESPONSE patterns by name, in the order they are tried. Listed
+# explicitly rather than built from globals() at import time, add any new ones here
+ALL_RESPONSES = {
+    "HUB_NAME_RESPONSE": HUB_NAME_RESPONSE,
+    "HUB_SERIAL_RESPONSE": HUB_SERIAL_RESPONSE,
+    "HUB_QUERY_DEVICE_RESPONSE": HUB_QUERY_DEVICE_RESPONSE,
+    "DEVICE_QUERY_NAME_RESPONSE": DEVICE_QUERY_NAME_RESPONSE,
+    "DEVICE_QUERY_POSITION_RESPONSE": DEVICE_QUERY_POSITION_RESPONSE,
+    "DEVICE_MOVE_TO_POSITION_RESPONSE": DEVICE_MOVE_TO_POSITION_RESPONSE,
+}
 
 TYPES = {
     "A": "AC motor",
@@ -52,9 +59,26 @@ TYPES = {
     "L": "Lighting devices",
 }
 
+# The device types that are rollers (covers)
+ROLLER_TYPES = "AUCDd"
+
 MovingAction = Enum("MovingAction", "stopped up down")
 
+# How move/stop commands are sent to the hub, auto picks the lowest latency transport
+# that is currently working, falling back to the other on failure
+Transport = Enum("Transport", "auto serial websocket")
+
+# The health of a roller, see health.HealthMonitor
+HealthStatus = Enum("HealthStatus", "ok stale suspect offline")
+
+# What sending a command does when the outbound queue of the hub is full, wait for
+# space or fail straight away with QueueFullException
+Backpressure = Enum("Backpressure", "wait fail")
+
+# The progress of a command sent to a roller, see tracking.CommandTracker
+CommandStatus = Enum("CommandStatus", "queued sent acked completed superseded expired")
+
 # Matter vendor/product ID to model mapping
 MATTER_MODEL_MAPPING = {
     (4938, 1): "Pulse Pro Hub",
-}
\ No newline at end of file
+}
@@ -2,19 +2,31 @@
 
 # Note, these are in the same file to prevent circular imports
 import asyncio
+import contextvars
 import functools
 import json
 import logging
-import ssl
 import time
-from typing import Any, Callable, Dict, List, Optional
-
-import async_timeout
-import websockets.exceptions
-from websockets.protocol import State
+from array import array
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Union
 
 from . import const, errors
-from .const import MovingAction
+from .const import Backpressure, MovingAction, Transport
+from .health import HealthMonitor
+from .index import RollerIndex
+from .journal import StateJournal
+from .ratelimit import CommandLimiter
+from .snapshot import (
+    HUB_STATE_FIELDS,
+    ROLLER_STATE_FIELDS,
+    HubSnapshot,
+    HubState,
+    RollerState,
+)
+from .telemetry import RollerTelemetry
+from .tracing import FrameTrace, Tracer
+from .tracking import CommandTracker, TrackedCommand
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -30,16 +42,86 @@ BATTERY_8V_MAX_VOLTAGE = 9.0
 # Fixes https://github.com/sillyfrog/Automate-Pulse-v2/issues/15
 ONLINE_MIN_VERSION = 0
 
-ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# The TCP ports of the hubs websocket and serial like protocol
+WEBSOCKET_PORT = 443
+SERIAL_PORT = 1487
+
+# Seconds to wait for the response to a serial command before treating it as failed
+SERIAL_COMMAND_TIMEOUT = 2
+
+# After a serial failure, the auto transport will use the websocket for this many
+# seconds before trying the serial connection again. Device names that were not
+# received are also requested again after this long.
+SERIAL_RETRY_DELAY = 60
+
+# Seconds without a response before the bulk device enumeration is considered complete
+ENUMERATE_TIMEOUT = 1
+
+# Seconds without a response before giving up on outstanding name requests
+NAME_QUERY_TIMEOUT = 3
+
+# Seconds between each check for rollers that have stopped reporting
+HEALTH_CHECK_INTERVAL = 60
+
+# The default number of payloads waiting to be written to the websocket, before
+# senders are held back (see Backpressure)
+OUTBOUND_QUEUE_SIZE = 64
+
+# Seconds allowed to write a payload to the websocket
+SEND_TIMEOUT = 10
+
+# Weight given to the latest sample in the moving average of the transport latency
+LATENCY_SMOOTHING = 0.3
+
+
+@functools.lru_cache(maxsize=None)
+def get_ssl_context():
+    """Returns the TLS context for the hub websocket, built on first use.
+
+    The hubs use a self signed certificate, so it is not verified.
+    """
+    import ssl
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def __getattr__(name: str) -> Any:
+    # ssl_context was a module global, it is now built when first needed
+    if name == "ssl_context":
+        return get_ssl_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def wsconnect(uri: str):
+    """Returns the websockets connection to uri.
+
+    websockets is imported here as it is slow to import, and not needed until the
+    first connection.
+    """
+    import websockets
+
+    return websockets.connect(uri, ssl=get_ssl_context())
 
 
 class Hub:
     """Representation of an Acmeda Pulse v2 Hub."""
 
     def __init__(
-        self, host: str, delay_callbacks: bool = True, propagate_callbacks: bool = False
+        self,
+        host: str,
+        delay_callbacks: bool = True,
+        propagate_callbacks: bool = False,
+        transport: Transport = Transport.websocket,
+        telemetry_size: int = 0,
+        journal: Union[StateJournal, str, None] = None,
+        command_rate: float = 0,
+        command_burst: int = 5,
+        outbound_queue_size: int = OUTBOUND_QUEUE_SIZE,
+        backpressure: Backpressure = Backpressure.wait,
+        tracer: Optional[Tracer] = None,
     ):
         """Init the hub.
 
@@ -48,6 +130,28 @@ class Hub:
             inital hub sync is complete, getting details such as the device name
         propagate_callbacks: If True, when there is a change to the hub, all roller
             callbacks are also notified.
+        transport: How move and stop commands are sent, Transport.websocket (default),
+            Transport.serial or Transport.auto to use the lowest latency transport,
+            failing over to the other.
+        telemetry_size: If not 0, each roller keeps a history of up to this many
+            recent battery, signal and position samples (older data is downsampled)
+            in Roller.telemetry.
+        journal: If set, the state and moves are journaled, and the last known state
+            is restored from it straight away. Unacknowledged moves are resent once
+            the first update is received from the hub, if needed. Either a
+            StateJournal, or a path including "{host}", which is replaced by the
+            host so each hub has its own file (needed when the same arguments are
+            used for several hubs, such as with SyncClient or ShardedHubs).
+        command_rate: If not 0, limit the move and stop commands sent to the hub to
+            this many per second, after an initial burst of command_burst. Waiting
+            commands are sent fairly between rollers, and a newer command for a
+            roller replaces one still waiting. See Hub.limiter for the metrics.
+        outbound_queue_size: The number of payloads that can be waiting to be sent
+            over the websocket.
+        backpressure: When the outbound queue is full, Backpressure.wait (default)
+            waits for space, Backpressure.fail raises QueueFullException.
+        tracer: If set, the time taken by each stage of processing the messages from
+            the hub is measured, see tracing.Tracer.
         """
         self.loop = asyncio.get_event_loop()
         self.handshake = asyncio.Event()
@@ -59,24 +163,83 @@ class Hub:
         self.lasterrorlog = None
         self.serialok = False
         self.lastserialerror = None
+        self.transport = transport
+        self.telemetry_size = telemetry_size
+        self.latency: Dict[Transport, Optional[float]] = {
+            Transport.serial: None,
+            Transport.websocket: None,
+        }
+        # The heartbeat shadow request, and when it was written to the websocket,
+        # the round trip is used as the websocket latency
+        self.shadow_request: Optional[Dict] = None
+        self.shadow_request_sent: Optional[float] = None
+        # Set once the hub is seen to echo the id of the shadow request, from then on
+        # only the matching response is used for the latency
+        self.shadow_id_echoed = False
 
         self.name = None
         self.id = None
         self.host = host
-        self.wsuri = "wss://{}:443/rpc".format(self.host)
+        # Incremented with each change to the hub or a roller, the generation of the
+        # last change is kept in changed_generation of the hub and each roller
+        self.generation = 0
+        self.changed_generation = 0
+        self.last_snapshot: Optional[HubSnapshot] = None
+        self.wsuri = "wss://{}:{}/rpc".format(self.host, WEBSOCKET_PORT)
         self.mac_address = None
         self.firmware_ver = None
         self.model = None
+        self.serial_number = None
 
         self.ws = None
 
         self.rollers = {}
+        # The closed percent of every roller in one array, -1 if unknown, the roller
+        # id of each entry is in position_ids. The Roller reads and writes this
+        # directly so bulk reads don't need to go through each Roller.
+        self.positions = array("h")
+        self.position_ids: List[str] = []
+        self.index = RollerIndex()
+        self.index_callbacks: List[Callable] = []
         self.unknown_rollers = set()
         self.rollers_known = asyncio.Event()
         self.rollers_known.clear()
         self.serialrunning = False
+        self.serial_task: Optional[asyncio.Task] = None
+        self.devices_enumerated = False
+        self.serial_reader = None
+        self.serial_writer = None
+        self.serial_lock = asyncio.Lock()
         self.sent_details_request = set()
+        # Details requests, moved to the outbound queue one per heartbeat
         self.payload_queue = []
+        # All websocket writes go through the writer task: (payload, future, resend)
+        # resend: if the write fails, send again once reconnected, else drop it
+        self.outbound: asyncio.Queue = asyncio.Queue(outbound_queue_size)
+        self.unsent: deque = deque()
+        self.backpressure = backpressure
+        self.writer_task: Optional[asyncio.Task] = None
+        # The item the writer task is sending (or waiting to send)
+        self.writing: Optional[tuple] = None
+        self.health = HealthMonitor(self)
+        self.tracker = CommandTracker()
+        self.tracer = tracer
+        self.limiter: Optional[CommandLimiter] = None
+        if command_rate:
+            self.limiter = CommandLimiter(command_rate, command_burst)
+
+        if isinstance(journal, str):
+            if "{host}" not in journal:
+                raise ValueError("The journal path must include {host}")
+            journal = StateJournal(journal.format(host=host))
+        self.journal = journal
+        self.reconciled = False
+        if journal is not None and journal.restore(self):
+            self.unknown_rollers.update(
+                rollerid for rollerid, roller in self.rollers.items() if not roller.name
+            )
+            if not self.unknown_rollers:
+                self.rollers_known.set()
 
         self.handshake.clear()
         self.update_callbacks: List[Callable] = []
@@ -103,6 +266,95 @@ class Hub:
         if callback in self.update_callbacks:
             self.update_callbacks.remove(callback)
 
+    def journal_changes(self):
+        """Record any changes in the journal, if there is one."""
+        if self.journal is not None:
+            self.journal.record(self.snapshot())
+
+    def restore_roller(self, rollerid: str, values: Dict[str, Any]):
+        """Add or update a roller from saved state, such as the journal."""
+        if rollerid not in self.rollers:
+            self.rollers[rollerid] = Roller(self, rollerid)
+        roller = self.rollers[rollerid]
+        moving = values.pop("moving", None)
+        self.applychanges(roller, values)
+        if moving is not None:
+            # Set directly, the moving setter would reset the target
+            roller._moving = moving
+
+    def mark_changed(self, obj: Any):
+        """Record that obj (the hub or a roller) has changed."""
+        self.generation += 1
+        obj.changed_generation = self.generation
+
+    def snapshot(self) -> HubSnapshot:
+        """Returns an immutable view of the hub and all rollers as they are now.
+
+        Only the rollers that have changed since the last snapshot are copied.
+        """
+        last = self.last_snapshot
+        if last is not None and last.version == self.generation:
+            return last
+        if last is None or self.changed_generation > last.version:
+            hubstate = HubState(*(getattr(self, f) for f in HUB_STATE_FIELDS))
+        else:
+            hubstate = last.hub
+        rollers = {}
+        for rollerid, roller in self.rollers.items():
+            state = last.rollers.get(rollerid) if last is not None else None
+            if state is None or roller.changed_generation > last.version:
+                state = RollerState(
+                    rollerid, *(getattr(roller, f) for f in ROLLER_STATE_FIELDS)
+                )
+            rollers[rollerid] = state
+        self.last_snapshot = HubSnapshot(self.host, self.generation, hubstate, rollers)
+        return self.last_snapshot
+
+    def allocate_position(self, rollerid: str) -> int:
+        """Add a slot for rollerid to positions, returns the index of the slot."""
+        self.positions.append(-1)
+        self.position_ids.append(rollerid)
+        return len(self.positions) - 1
+
+    def closed_percents(self) -> Dict[str, Optional[int]]:
+        """Returns the closed percent of all rollers, by roller id."""
+        return {
+            rollerid: None if percent < 0 else percent
+            for rollerid, percent in zip(self.position_ids, self.positions)
+        }
+
+    def reindex(self, roller: "Roller", attr: str, old: Any, new: Any):
+        """Update the indexes after attr of roller changed from old to new.
+
+        This is called by the Roller, the index_callbacks are passed the same
+        arguments so containers of several hubs can keep their own indexes.
+        """
+        self.index.update(roller, attr, old, new)
+        self.mark_changed(roller)
+        for callback in self.index_callbacks:
+            callback(roller, attr, old, new)
+
+    def get_roller(self, name: str) -> Optional["Roller"]:
+        """Returns the roller called name, or None if unknown."""
+        return self.index.get_roller(name)
+
+    async def wait_for_roller(
+        self, name: str, timeout: Optional[float] = None
+    ) -> "Roller":
+        """Returns the roller called name, waiting until it's discovered.
+
+        Raises asyncio.TimeoutError if not discovered within timeout seconds.
+        """
+        return await self.index.wait_for_roller(name, timeout)
+
+    def rollers_of_type(self, devicetypeshort: str) -> List["Roller"]:
+        """Returns the rollers with the single letter type, see const.TYPES."""
+        return self.index.find("devicetypeshort", devicetypeshort)
+
+    def rollers_in_room(self, room: str) -> List["Roller"]:
+        """Returns the rollers that have been assigned to room."""
+        return self.index.find("room", room)
+
     def async_add_job(
         self, target: Callable[..., Any], *args: Any
     ) -> Optional[asyncio.Future]:
@@ -125,7 +377,12 @@ class Hub:
         elif asyncio.iscoroutinefunction(check_target):
             task = self.loop.create_task(target(*args))
         else:
-            task = self.loop.run_in_executor(None, target, *args)  # type: ignore
+            # In a copy of the context, as tasks are, so the callback still sees the
+            # context variables such as tracing.current_trace
+            context = contextvars.copy_context()
+            task = self.loop.run_in_executor(
+                None, context.run, target, *args  # type: ignore
+            )
 
         return task
 
@@ -144,14 +401,32 @@ class Hub:
         _LOGGER.debug("%s: Disconnecting", self.host)
         if self.ws:
             await self.ws.close()
+        self.close_serial()
         self.handshake.clear()
         _LOGGER.info("%s: Disconnected", self.host)
 
-    def response_parse(self, response: str):
-        """Decode response."""
+    def response_parse(self, response: str) -> Optional[str]:
+        """Decode response.
+
+        Returns the name of the matched response, or None if it's not known.
+        """
+        if self.tracer is None:
+            return self.parseresponse(response, None)
+        trace = self.tracer.start("serial", self.host)
+        try:
+            return self.parseresponse(response, trace)
+        finally:
+            self.tracer.finish(trace)
+
+    def parseresponse(
+        self, response: str, trace: Optional[FrameTrace]
+    ) -> Optional[str]:
+        """Decode response, see response_parse. Stages traced: match, handler."""
         for name, matcher in const.ALL_RESPONSES.items():
             match = matcher.match(response)
             if match:
+                if trace:
+                    trace.mark("match")
                 _LOGGER.debug(
                     "%s: Received response: %s content: %s",
                     self.host,
@@ -161,10 +436,40 @@ class Hub:
                 handler = getattr(self, "handle_" + name.lower(), "")
                 if handler:
                     handler(**match.groupdict())
+                    self.journal_changes()
                 else:
                     _LOGGER.debug("No handler for %s", name)
-                return
+                if trace:
+                    trace.mark("handler")
+                return name
         _LOGGER.debug("No match for: %s", response)
+        return None
+
+    def handle_hub_name_response(self, name: str):
+        if self.name is None:
+            # The websocket is the primary source, this is only to fill the gap
+            self.name = name
+            self.mark_changed(self)
+
+    def handle_hub_serial_response(self, serial: str):
+        self.serial_number = serial
+
+    def handle_hub_query_device_response(self, id: str, devicetype: str, version: str):
+        if devicetype not in const.ROLLER_TYPES:
+            # The hub itself, or a device that isn't a cover (such as a socket),
+            # these are not in the shadow shades
+            return
+        if id not in self.rollers:
+            self.rollers[id] = Roller(self, id)
+            self.unknown_rollers.add(id)
+            self.rollers_known.clear()
+        newvals = {
+            "devicetypeshort": devicetype,
+            "devicetype": devicetypename(devicetype),
+            "version": version,
+        }
+        if self.applychanges(self.rollers[id], newvals):
+            self.rollers[id].notify_callback()
 
     def handle_device_query_position_response(
         self, id: str, closedpercent: str, tiltpercent: str, signal: str
@@ -172,6 +477,17 @@ class Hub:
         self.rollers[id].closed_percent = forcetoint(closedpercent)
         self.rollers[id].tilt_percent = forcetoint(tiltpercent)
         self.rollers[id].set_signal(signal)
+        self.mark_changed(self.rollers[id])
+        if self.rollers[id].telemetry:
+            self.rollers[id].telemetry.record(self.rollers[id])
+
+    def handle_device_move_to_position_response(
+        self, id: str, closedpercent: str, signal: str
+    ):
+        self.rollers[id].target_closed_percent = forcetoint(closedpercent)
+        self.rollers[id].set_signal(signal)
+        self.mark_changed(self.rollers[id])
+        self.rollers[id].notify_callback()
 
     def handle_device_query_name_response(self, id: str, name: str):
         self.rollers[id].name = name
@@ -182,37 +498,92 @@ class Hub:
             self.rollers_known.set()
             self.notify_callback()
 
+    async def serialread(
+        self,
+        reader: asyncio.StreamReader,
+        timeout: float,
+        done: Callable[[], bool],
+        onresponse: Optional[Callable[[], None]] = None,
+    ) -> bool:
+        """Parse responses from reader until done() returns True
+
+        onresponse: called after each response is parsed
+        Returns True if done, or False if there was no response for timeout seconds.
+        """
+        try:
+            while not done():
+                async with asyncio.timeout(timeout):
+                    response = await reader.readuntil(b";")
+                _LOGGER.debug("recv < %s", response)
+                self.response_parse(response.decode())
+                if onresponse is not None:
+                    onresponse()
+        except asyncio.TimeoutError:
+            return False
+        return True
+
     async def serialrunner(self):
         """The running to get all required information from the hub
 
-        This will exit when complete.
+        The first pass enumerates every device (type and version) with a single
+        request. The name of each device not yet known is requested as soon as the
+        device is seen, either in the enumeration or the shadow. Names that don't
+        get a reply are requested again after SERIAL_RETRY_DELAY.
+        This will exit when complete, or once the hub is stopped.
         """
-        self.serialrunning = True
         try:
-            while self.unknown_rollers:
-                self.rollers_known.clear()  # We have some unknown rollers
-                reader, writer = await asyncio.open_connection(self.host, port=1487)
-                # Send off a request for all of the unknown rollers
-                for rollerid in self.unknown_rollers:
-                    buf = const.DEVICE_QUERY_NAME.format(id=rollerid)
-                    writer.write(buf.encode())
-                while True:
-                    async with async_timeout.timeout(3):
-                        response = await reader.readuntil(b";")
-                    if len(response) > 0:
-                        _LOGGER.debug("recv < %s", response)
-                        self.response_parse(response.decode())
-                    else:
-                        break
-                # Nothing has happened for > 30 seconds, disconnet
+            while self.running and (
+                not self.devices_enumerated or self.unknown_rollers
+            ):
+                try:
+                    reader, writer = await asyncio.open_connection(
+                        self.host, port=SERIAL_PORT
+                    )
+                except OSError as e:
+                    _LOGGER.info("%s: Unable to connect to serial: %s", self.host, e)
+                    await asyncio.sleep(SERIAL_RETRY_DELAY)
+                    continue
+                requested = set()
+
+                def request_names():
+                    for rollerid in self.unknown_rollers - requested:
+                        buf = const.DEVICE_QUERY_NAME.format(id=rollerid)
+                        writer.write(buf.encode())
+                        requested.add(rollerid)
+
+                if self.name is None:
+                    writer.write(const.HUB_NAME.encode())
+                request_names()
+                if not self.devices_enumerated:
+                    writer.write((const.HUB_QUERY_DEVICES + const.HUB_SERIAL).encode())
+                    # There is no end marker, so read until the responses stop
+                    await self.serialread(
+                        reader, ENUMERATE_TIMEOUT, lambda: False, request_names
+                    )
+                    self.devices_enumerated = True
+                request_names()
+                complete = await self.serialread(
+                    reader,
+                    NAME_QUERY_TIMEOUT,
+                    lambda: not self.unknown_rollers,
+                    request_names,
+                )
                 writer.close()
-                # Sleep 10 seconds to wait for things to settle down before maybe trying again
-                await asyncio.sleep(10)
-        except (asyncio.TimeoutError, asyncio.CancelledError):
+                if not complete:
+                    _LOGGER.info(
+                        "%s: No name received for %s, retrying later",
+                        self.host,
+                        ", ".join(sorted(self.unknown_rollers)),
+                    )
+                    await asyncio.sleep(SERIAL_RETRY_DELAY)
+        except asyncio.CancelledError:
             pass
         except Exception as e:
             _LOGGER.info("Error in serial running: %s", e)
-        self.serialrunning = False
+        if self.serial_task is asyncio.current_task():
+            # Not replaced by a newer run since stop_serial()
+            self.serial_task = None
+            self.serialrunning = False
 
     async def runserial(self):
         """Runs a 'serial' connection to the hub to get additional information"""
@@ -220,18 +591,238 @@ class Hub:
             # Already running, don't start again
             return
         self.serialrunning = True
-        asyncio.create_task(self.serialrunner())
+        self.serial_task = asyncio.create_task(self.serialrunner())
+
+    def stop_serial(self):
+        """Stop getting information over the serial connection, if running."""
+        if self.serial_task is not None:
+            self.serial_task.cancel()
+            self.serial_task = None
+        self.serialrunning = False
+
+    def record_latency(self, transport: Transport, seconds: float):
+        """Add a latency sample to the moving average for transport."""
+        current = self.latency[transport]
+        if current is None:
+            self.latency[transport] = seconds
+        else:
+            self.latency[transport] = (
+                LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * current
+            )
+
+    def transport_order(self) -> List[Transport]:
+        """Returns the transports to try, in order, for the next command."""
+        if self.transport == Transport.serial:
+            return [Transport.serial, Transport.websocket]
+        if self.transport == Transport.websocket:
+            return [Transport.websocket]
+        if (
+            self.lastserialerror is not None
+            and time.time() - self.lastserialerror < SERIAL_RETRY_DELAY
+        ):
+            return [Transport.websocket, Transport.serial]
+        seriallatency = self.latency[Transport.serial]
+        wslatency = self.latency[Transport.websocket]
+        if seriallatency is None or wslatency is None or seriallatency <= wslatency:
+            # An unmeasured serial connection is tried so it gets a latency figure
+            return [Transport.serial, Transport.websocket]
+        return [Transport.websocket, Transport.serial]
+
+    def close_serial(self):
+        """Close the command serial connection, if open."""
+        if self.serial_writer:
+            self.serial_writer.close()
+        self.serial_reader = None
+        self.serial_writer = None
+
+    async def send_serial(self, command: str, expect: str) -> bool:
+        """Send command over the serial connection and wait for the response
+
+        The connection is kept open between commands to keep the latency down.
+        expect: The start of the response that acknowledges the command, all
+            responses received are parsed.
+        Returns True once the response is received, False on any failure.
+        """
+        async with self.serial_lock:
+            start = time.monotonic()
+            try:
+                async with asyncio.timeout(SERIAL_COMMAND_TIMEOUT):
+                    if self.serial_writer is None or self.serial_writer.is_closing():
+                        connection = await asyncio.open_connection(
+                            self.host, port=SERIAL_PORT
+                        )
+                        self.serial_reader, self.serial_writer = connection
+                    _LOGGER.debug("%s: serial send > %s", self.host, command)
+                    self.serial_writer.write(command.encode())
+                    await self.serial_writer.drain()
+                    while True:
+                        response = (await self.serial_reader.readuntil(b";")).decode()
+                        _LOGGER.debug("%s: serial recv < %s", self.host, response)
+                        self.response_parse(response)
+                        if response.startswith(expect):
+                            break
+            except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError) as e:
+                _LOGGER.info("%s: Error sending serial command: %r", self.host, e)
+                self.close_serial()
+                self.serialok = False
+                self.lastserialerror = time.time()
+                return False
+            self.record_latency(Transport.serial, time.monotonic() - start)
+            self.serialok = True
+            return True
+
+    async def send_command(self, serialcommand: str, expect: str, jscommand: Dict):
+        """Send a command using the transport(s) selected for the hub
+
+        serialcommand/expect: the command and response prefix, see send_serial
+        jscommand: the equivalent websocket payload, see sendws
+        """
+        if not self.running:
+            raise errors.NotRunningException
+        for transport in self.transport_order():
+            if transport == Transport.serial:
+                if await self.send_serial(serialcommand, expect):
+                    return
+            else:
+                await self.send_payload(jscommand)
+                return
+        _LOGGER.warning("%s: Unable to send command %s", self.host, serialcommand)
+
+    async def limited(self, key: Hashable, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Run send(), subject to the command rate limit of the hub (if any)
+
+        key: identifies what the command is for, normally the roller id, a waiting
+            command is replaced by a newer one with the same key.
+        """
+        if self.limiter is None:
+            return await send()
+        return await self.limiter.submit(key, send)
+
+    async def move_many(self, positions: Dict[str, int]) -> Dict[str, TrackedCommand]:
+        """Move several rollers at once, with a single websocket shadow frame
+
+        positions: the percent closed to move to, keyed by the roller id.
+        This always uses the websocket, as the serial protocol can only address one
+        roller per command.
+        Returns the TrackedCommand of each roller, by roller id.
+        """
+        shades = {}
+        commands = {}
+        for rollerid, percent in positions.items():
+            roller = self.rollers[rollerid]
+            commands[rollerid] = self.tracker.track(
+                rollerid, int(percent), roller.closed_percent
+            )
+            roller.set_target(percent)
+            shades[rollerid] = {"movePercent": int(percent)}
+
+        async def send():
+            for command in commands.values():
+                self.tracker.sent(command)
+            await self.send_payload(
+                {
+                    "method": "shadow",
+                    "args": {"desired": {"shades": shades}, "timeStamp": time.time()},
+                }
+            )
+
+        # Each call is its own key, it is not merged with other commands
+        await self.limited(object(), send)
+        return commands
 
     async def send_payload(self, jscommand: Dict):
-        """Send payload to the hub
+        """Send payload to the hub, and wait until it has been written
 
-        See sendws for details.
+        The payload is queued for the writer task, and will be sent again after a
+        reconnect if the write fails. If the queue is full this waits for space, or
+        raises QueueFullException, depending on the backpressure of the hub.
         """
         if not self.running:
             raise errors.NotRunningException
-        await self.handshake.wait()
         _LOGGER.debug("Sending payload: %s", jscommand)
-        await self.sendws(jscommand)
+        future = self.loop.create_future()
+        item = (jscommand, future, True)
+        if self.backpressure == Backpressure.fail:
+            try:
+                self.outbound.put_nowait(item)
+            except asyncio.QueueFull:
+                raise errors.QueueFullException from None
+        else:
+            await self.outbound.put(item)
+            if not self.running:
+                # Stopped while waiting for space, the writer won't send it
+                future.cancel()
+                raise errors.NotRunningException
+        await future
+
+    def queue_poll(self, jscommand: Dict) -> bool:
+        """Queue a payload that doesn't matter if lost, such as a shadow request
+
+        It is dropped if the queue is full or the write fails. Returns True if
+        queued.
+        """
+        try:
+            self.outbound.put_nowait((jscommand, None, False))
+        except asyncio.QueueFull:
+            _LOGGER.debug("%s: Outbound queue full, dropping %s", self.host, jscommand)
+            return False
+        return True
+
+    async def writer(self):
+        """Write the queued payloads to the websocket, one at a time."""
+        while self.running:
+            if self.unsent:
+                item = self.unsent.popleft()
+            else:
+                item = await self.outbound.get()
+            jscommand, future, resend = item
+            if future is not None and future.done():
+                # The sender has given up (cancelled)
+                continue
+            self.writing = item
+            try:
+                await self.handshake.wait()
+                sent = await self.sendws(jscommand)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Such as a payload that can't be converted to JSON, only the
+                # sender of the payload needs to know
+                if future is not None:
+                    future.set_exception(e)
+                else:
+                    _LOGGER.warning("%s: Error sending %s: %r", self.host, jscommand, e)
+                continue
+            finally:
+                self.writing = None
+            if sent:
+                if jscommand is self.shadow_request:
+                    self.shadow_request_sent = time.monotonic()
+                if future is not None:
+                    future.set_result(None)
+            elif resend:
+                self.unsent.appendleft(item)
+            else:
+                _LOGGER.debug("%s: Dropping unsent %s", self.host, jscommand)
+
+    def start_writer(self):
+        if self.writer_task is None or self.writer_task.done():
+            self.writer_task = asyncio.create_task(self.writer())
+
+    def stop_writer(self):
+        """Stop the writer task, failing all payloads not yet sent."""
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+            self.writer_task = None
+        if self.writing is not None:
+            self.unsent.append(self.writing)
+            self.writing = None
+        while not self.outbound.empty():
+            self.unsent.append(self.outbound.get_nowait())
+        while self.unsent:
+            future = self.unsent.popleft()[1]
+            if future is not None and not future.done():
+                future.set_exception(errors.NotRunningException())
 
     async def sendws(self, jscommand: Dict) -> bool:
         """Send jscommand over the websocket
@@ -240,8 +831,11 @@ class Hub:
         Returns True on success
         """
         if self.ws:
+            # Already imported by wsconnect, as there is a websocket
+            import websockets.exceptions
+
             try:
-                async with async_timeout.timeout(10):
+                async with asyncio.timeout(SEND_TIMEOUT):
                     await self.ws.send(json.dumps(jscommand))
                 return True
             except (
@@ -252,25 +846,43 @@ class Hub:
                 self.handshake.clear()
         return False
 
+    def queue_details_request(self, rollerid: str):
+        """Queue a request for the hub to send all details of rollerid."""
+        self.payload_queue.append(
+            {
+                "method": "shadow",
+                "args": {
+                    "desired": {"shades": {rollerid: {"query": True}}},
+                    "timeStamp": time.time(),
+                },
+            }
+        )
+        self.sent_details_request.add(rollerid)
+        self.health.record_query(rollerid)
+
     async def heartbeat(self):
-        reset_request_counter = 3600 / self.heartbeatinterval
+        from websockets.protocol import State
+
+        lasthealthcheck = time.time()
         while self.running:
             if self.ws and self.ws.state == State.OPEN and self.handshake.is_set():
                 if self.payload_queue:
-                    payload = self.payload_queue.pop(0)
-                    success = await self.sendws(payload)
-                    if not success:
-                        self.payload_queue.append(payload)
-                await self.sendws(
-                    {"method": "shadow", "src": "app", "id": int(time.time())}
-                )
+                    try:
+                        self.outbound.put_nowait((self.payload_queue[0], None, True))
+                        self.payload_queue.pop(0)
+                    except asyncio.QueueFull:
+                        pass
+                poll = {"method": "shadow", "src": "app", "id": int(time.time())}
+                if self.queue_poll(poll):
+                    self.shadow_request = poll
+                    self.shadow_request_sent = None
             await asyncio.sleep(self.heartbeatinterval)
-            reset_request_counter -= 1
-            if reset_request_counter <= 0:
-                # About once an hour allow a request to be made to the hub to get the
-                # rollers details again
-                self.sent_details_request.clear()
-                reset_request_counter = 3600 / self.heartbeatinterval
+            if time.time() - lasthealthcheck >= HEALTH_CHECK_INTERVAL:
+                # Request the details again of only the rollers that have stopped
+                # reporting
+                self.health.check()
+                self.tracker.expire()
+                lasthealthcheck = time.time()
 
     def applychanges(self, obj: Any, newvalues: Dict[str, Any]) -> bool:
         """Applies and reports changes from newvals to the attributes of obj
@@ -282,9 +894,25 @@ class Hub:
             if getattr(obj, attr) != val:
                 setattr(obj, attr, val)
                 updated = True
+        if updated:
+            self.mark_changed(obj)
         return updated
 
     async def wsconsumer(self, msg: str):
+        if self.tracer is None:
+            await self.processframe(msg, None)
+            return
+        trace = self.tracer.start("websocket", self.host)
+        try:
+            await self.processframe(msg, trace)
+        finally:
+            self.tracer.finish(trace)
+
+    async def processframe(self, msg: str, trace: Optional[FrameTrace]):
+        """Apply a message from the websocket
+
+        Stages traced: decode, repair, hub, shades, callbacks and journal.
+        """
         try:
             jsmsg = json.loads(msg)
         except json.JSONDecodeError as e:
@@ -299,20 +927,35 @@ class Hub:
                     "Attempting to fix JSON by adding %d missing closing braces",
                     missing_braces,
                 )
+                if trace:
+                    trace.mark("decode")
                 try:
                     jsmsg = json.loads(fixed_msg)
                     _LOGGER.debug("Successfully fixed truncated JSON")
                 except json.JSONDecodeError:
                     _LOGGER.error("Could not fix JSON even after adding missing braces")
                     return
+                finally:
+                    if trace:
+                        trace.mark("repair")
             else:
                 return
+        if trace:
+            trace.mark("decode")
 
         if "result" not in jsmsg or "reported" not in jsmsg["result"]:
             _LOGGER.info("Got unknown WS response: %s", msg)
             return
+        if self.shadow_request_sent is not None and self.is_shadow_response(jsmsg):
+            # The round trip of the heartbeat is used as the websocket latency
+            self.record_latency(
+                Transport.websocket, time.monotonic() - self.shadow_request_sent
+            )
+            self.shadow_request = None
+            self.shadow_request_sent = None
         if not self.connected:
             self.connected = True
+            self.mark_changed(self)
             self.notify_callback()
         if self.lasterrorlog is not None:
             _LOGGER.info("Connected to %s", self.host)
@@ -337,11 +980,14 @@ class Hub:
             "model": model,
         }
         hubchanges = self.applychanges(self, newvals)
+        if trace:
+            trace.mark("hub")
 
         for rollerid, roller in data["shades"].items():
             if rollerid not in self.rollers:
                 self.rollers[rollerid] = Roller(self, rollerid)
                 self.unknown_rollers.add(rollerid)
+                self.rollers_known.clear()
                 await self.runserial()
                 hubchanges = True
 
@@ -356,25 +1002,13 @@ class Hub:
                 # not already sent. If this request is not made, it will typically
                 # be sent through with in about 20 minutes
                 if rollerid not in self.sent_details_request:
-                    self.payload_queue.append(
-                        {
-                            "method": "shadow",
-                            "args": {
-                                "desired": {"shades": {rollerid: {"query": True}}},
-                                "timeStamp": time.time(),
-                            },
-                        }
-                    )
-                    self.sent_details_request.add(rollerid)
+                    self.queue_details_request(rollerid)
             else:
                 batteryinfo = const.WS_ROLLER_VOLTAGE.match(roller["vo"])
                 if batteryinfo:
                     newvals["battery"] = float(batteryinfo.group("voltage"))
                     newvals["devicetypeshort"] = batteryinfo.group("type")
-                    newvals["devicetype"] = const.TYPES.get(
-                        batteryinfo.group("type"),
-                        f"unknown {batteryinfo.group('type')}",
-                    )
+                    newvals["devicetype"] = devicetypename(batteryinfo.group("type"))
                     newvals["version"] = batteryinfo.group("version")
 
             try:
@@ -387,11 +1021,48 @@ class Hub:
             except Exception:
                 pass
 
-            if self.applychanges(self.rollers[rollerid], newvals):
+            changed = self.applychanges(self.rollers[rollerid], newvals)
+            if rollerid in self.tracker.pending:
+                self.tracker.observe(
+                    rollerid, newvals["moving"], newvals["closed_percent"]
+                )
+            self.health.record(rollerid, changed, "vo" in roller)
+            if self.rollers[rollerid].telemetry:
+                self.rollers[rollerid].telemetry.record(self.rollers[rollerid])
+            if changed:
+                if trace:
+                    trace.mark("shades")
                 self.rollers[rollerid].notify_callback()
+                if trace:
+                    trace.mark("callbacks")
+        if trace:
+            trace.mark("shades")
 
         if hubchanges:
             self.notify_callback()
+            if trace:
+                trace.mark("callbacks")
+
+        self.journal_changes()
+        if self.journal is not None and not self.reconciled:
+            self.reconciled = True
+            if self.journal.restored:
+                self.journal.reconcile(self)
+        if trace and self.journal is not None:
+            trace.mark("journal")
+
+    def is_shadow_response(self, jsmsg: Dict) -> bool:
+        """Returns True if jsmsg is the response to the heartbeat shadow request
+
+        If the hub doesn't echo the id of the request, the first frame after the
+        request is taken as the response.
+        """
+        if "id" in jsmsg:
+            if jsmsg["id"] == self.shadow_request["id"]:
+                self.shadow_id_echoed = True
+                return True
+            return False
+        return not self.shadow_id_echoed
 
     async def run(self):
         """Start hub by connecting then awaiting for messages.
@@ -403,20 +1074,28 @@ class Hub:
             return
         self.running = True
 
+        if self.journal is not None:
+            self.journal.reopen()
+        self.start_writer()
         asyncio.create_task(self.heartbeat())
+        # Start device discovery over the serial connection straight away, so the
+        # device details are typically known before the first shadow arrives
+        await self.runserial()
         while self.running:
             try:
-                async with websockets.connect(self.wsuri, ssl=ssl_context) as websocket:
+                async with wsconnect(self.wsuri) as websocket:
                     self.ws = websocket
                     self.handshake.set()
                     async for message in websocket:
                         await self.wsconsumer(message)
             except Exception as e:
                 self.ws = None
+                self.handshake.clear()
                 if self.running and self.lasterrorlog != errors.CannotConnectException:
                     _LOGGER.warning("Websocket Connection closed: %s", e)
                     self.lasterrorlog = errors.CannotConnectException
                 self.connected = False
+                self.mark_changed(self)
                 self.notify_callback()
                 if self.running:
                     await asyncio.sleep(10)
@@ -432,22 +1111,31 @@ class Hub:
         if connection succeeded.
         """
         self.running = True
-        async with websockets.connect(self.wsuri, ssl=ssl_context) as websocket:
-            self.ws = websocket
-            asyncio.create_task(self.heartbeat())
-            self.handshake.set()
-            async for message in websocket:
-                await self.wsconsumer(message)
-                if self.connected:
-                    self.running = False
-                    break
-                else:
-                    raise errors.InvalidResponseException
-        # Now connected, wait for the initial device listing to be populated
-        if update_devices:
-            await self.rollers_known.wait()
-        self.ws = None
+        try:
+            async with wsconnect(self.wsuri) as websocket:
+                self.ws = websocket
+                self.start_writer()
+                asyncio.create_task(self.heartbeat())
+                self.handshake.set()
+                async for message in websocket:
+                    await self.wsconsumer(message)
+                    if self.connected:
+                        break
+                    else:
+                        raise errors.InvalidResponseException
+            # Now connected, wait for the initial device listing to be populated,
+            # still running so the serial discovery can retry
+            if update_devices:
+                await self.rollers_known.wait()
+        finally:
+            # Also on failure or cancellation (such as a probe timeout), otherwise
+            # the writer and serial tasks are left running
+            self.running = False
+            self.ws = None
+            self.stop_writer()
+            self.stop_serial()
         self.connected = False
+        self.mark_changed(self)
         return True
 
     async def stop(self):
@@ -458,21 +1146,49 @@ class Hub:
         _LOGGER.debug("%s: Stopping", self.host)
         self.running = False
         await self.disconnect()
+        self.stop_writer()
+        self.stop_serial()
+        self.journal_changes()
+        if self.journal is not None:
+            self.journal.close()
 
 
 class Roller:
     """Representation of a Roller blind."""
 
+    # Slots keep the memory use down for sites with thousands of rollers
+    __slots__ = (
+        "hub",
+        "id",
+        "_name",
+        "_devicetypeshort",
+        "_room",
+        "devicetype",
+        "battery",
+        "target_closed_percent",
+        "_position",
+        "tilt_percent",
+        "signal",
+        "version",
+        "_moving",
+        "action",
+        "online",
+        "update_callbacks",
+        "telemetry",
+        "changed_generation",
+    )
+
     def __init__(self, hub: Hub, roller_id: str):
         """Init a new roller blind."""
         self.hub = hub
         self.id = roller_id
-        self.name = None
-        self.devicetypeshort = None
+        self._position = hub.allocate_position(roller_id)
+        self._name = None
+        self._devicetypeshort = None
+        self._room = None
         self.devicetype = None
         self.battery = None
         self.target_closed_percent = None
-        self.closed_percent = None
         self.tilt_percent = None
         self.signal = None
         self.version = None
@@ -480,6 +1196,10 @@ class Roller:
         self.action = MovingAction.stopped
         self.online = False
         self.update_callbacks: List[Callable] = []
+        self.telemetry: Optional[RollerTelemetry] = None
+        self.changed_generation = 0
+        if hub.telemetry_size:
+            self.telemetry = RollerTelemetry(hub.telemetry_size)
 
     def __str__(self):
         """Returns string representation of roller."""
@@ -504,6 +1224,55 @@ class Roller:
             actiontxt,
         )
 
+    @property
+    def closed_percent(self) -> Optional[int]:
+        percent = self.hub.positions[self._position]
+        if percent < 0:
+            return None
+        return percent
+
+    @closed_percent.setter
+    def closed_percent(self, new_val: Optional[int]):
+        self.hub.positions[self._position] = -1 if new_val is None else new_val
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, new_val):
+        old_val = self._name
+        self._name = new_val
+        if old_val != new_val:
+            self.hub.reindex(self, "name", old_val, new_val)
+
+    @property
+    def devicetypeshort(self):
+        return self._devicetypeshort
+
+    @devicetypeshort.setter
+    def devicetypeshort(self, new_val):
+        old_val = self._devicetypeshort
+        self._devicetypeshort = new_val
+        if old_val != new_val:
+            self.hub.reindex(self, "devicetypeshort", old_val, new_val)
+
+    @property
+    def room(self):
+        """The room/group of the roller.
+
+        This is not reported by the hub, it may be set by the application so
+        rollers can be looked up by room.
+        """
+        return self._room
+
+    @room.setter
+    def room(self, new_val):
+        old_val = self._room
+        self._room = new_val
+        if old_val != new_val:
+            self.hub.reindex(self, "room", old_val, new_val)
+
     @property
     def battery_percent(self):
         """A rough approximation base on the app vs voltage levels read.
@@ -572,8 +1341,8 @@ class Roller:
             signal = int(signal, 16)
         self.signal = signal
 
-    async def move_to(self, percent: int):
-        """Send command to move the roller to a percentage closed."""
+    def set_target(self, percent: int):
+        """Optimistically update the state for a move to percent closed."""
         if forcetoint(self.version) < ONLINE_MIN_VERSION:
             self.closed_percent = percent
         else:
@@ -588,36 +1357,75 @@ class Roller:
                 self.action = MovingAction.stopped
             self._moving = True
             self.target_closed_percent = percent
+        self.hub.mark_changed(self)
+        if self.hub.journal is not None:
+            self.hub.journal.record_command(self.id, int(percent))
+            self.hub.journal_changes()
         self.notify_callback()
-        await self.hub.send_payload(
-            {
-                "method": "shadow",
-                "args": {
-                    "desired": {"shades": {self.id: {"movePercent": int(percent)}}},
-                    "timeStamp": time.time(),
+
+    async def move_to(self, percent: int) -> TrackedCommand:
+        """Send command to move the roller to a percentage closed.
+
+        Returns the TrackedCommand, to follow the progress of the move.
+        """
+        command = self.hub.tracker.track(self.id, int(percent), self.closed_percent)
+        self.set_target(percent)
+
+        async def send():
+            self.hub.tracker.sent(command)
+            await self.hub.send_command(
+                const.DEVICE_MOVE_TO_POSITION.format(
+                    id=self.id, closedpercent=int(percent)
+                ),
+                f"!{self.id}m",
+                {
+                    "method": "shadow",
+                    "args": {
+                        "desired": {"shades": {self.id: {"movePercent": int(percent)}}},
+                        "timeStamp": time.time(),
+                    },
                 },
-            }
-        )
+            )
 
-    async def move_up(self):
-        """Send command to move the roller to fully open."""
-        await self.move_to(0)
+        await self.hub.limited(self.id, send)
+        return command
 
-    async def move_down(self):
-        """Send command to move the roller to fully closed."""
-        await self.move_to(100)
+    async def move_up(self) -> TrackedCommand:
+        """Send command to move the roller to fully open, see move_to."""
+        return await self.move_to(0)
 
-    async def move_stop(self):
-        """Send command to stop the roller."""
-        await self.hub.send_payload(
-            {
-                "method": "shadow",
-                "args": {
-                    "desired": {"shades": {self.id: {"stopShade": True}}},
-                    "timeStamp": time.time(),
+    async def move_down(self) -> TrackedCommand:
+        """Send command to move the roller to fully closed, see move_to."""
+        return await self.move_to(100)
+
+    async def move_stop(self) -> TrackedCommand:
+        """Send command to stop the roller.
+
+        Returns the TrackedCommand, to follow the progress of the stop.
+        """
+        command = self.hub.tracker.track(self.id, None, self.closed_percent)
+
+        async def send():
+            self.hub.tracker.sent(command)
+            await self.hub.send_command(
+                const.DEVICE_STOP.format(id=self.id),
+                f"!{self.id}r",
+                {
+                    "method": "shadow",
+                    "args": {
+                        "desired": {"shades": {self.id: {"stopShade": True}}},
+                        "timeStamp": time.time(),
+                    },
                 },
-            }
-        )
+            )
+
+        await self.hub.limited(self.id, send)
+        return command
+
+
+def devicetypename(devicetypeshort: str) -> str:
+    """Returns the description of the single letter device type"""
+    return const.TYPES.get(devicetypeshort, f"unknown {devicetypeshort}")
 
 
 def forcetoint(src) -> int:
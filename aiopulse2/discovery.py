@@ -0,0 +1,114 @@
+"""Concurrent probing and network discovery of Pulse Hubs."""
+
+import asyncio
+import ipaddress
+import logging
+from typing import AsyncIterator, Iterable, Optional, Tuple, Union
+
+from .devices import SERIAL_PORT, WEBSOCKET_PORT, Hub
+
+_LOGGER = logging.getLogger(__name__)
+
+# The result of a probe: (host, hub, error), hub is None if error is set
+ProbeResult = Tuple[str, Optional[Hub], Optional[Exception]]
+
+
+async def port_open(host: str, port: int, timeout: float) -> bool:
+    """Returns True if a TCP connection to host:port can be made within timeout."""
+    try:
+        async with asyncio.timeout(timeout):
+            _, writer = await asyncio.open_connection(host, port)
+    except (asyncio.TimeoutError, OSError):
+        return False
+    writer.close()
+    return True
+
+
+async def probe_hub(
+    host: str, timeout: float = 10, update_devices: bool = False
+) -> ProbeResult:
+    """Run Hub.test on host, giving up after timeout seconds.
+
+    Exceptions (including the timeout) are returned rather than raised.
+    """
+    hub = Hub(host)
+    try:
+        async with asyncio.timeout(timeout):
+            await hub.test(update_devices)
+    except Exception as e:
+        # Stops the heartbeat started by the test
+        hub.running = False
+        _LOGGER.debug("%s: Probe failed: %r", host, e)
+        return host, None, e
+    return host, hub, None
+
+
+async def probe_hubs(
+    hosts: Iterable[str],
+    concurrency: int = 16,
+    timeout: float = 10,
+    update_devices: bool = False,
+) -> AsyncIterator[ProbeResult]:
+    """Probe hosts in parallel, yielding (host, hub, error) as each one finishes.
+
+    concurrency: the maximum number of probes running at once
+    timeout: the overall time allowed for each host, see Hub.test
+    update_devices: passed to Hub.test
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(host: str) -> ProbeResult:
+        async with semaphore:
+            return await probe_hub(host, timeout, update_devices)
+
+    tasks = [asyncio.create_task(limited(host)) for host in hosts]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def scan_subnet(
+    network: Union[str, ipaddress.IPv4Network],
+    concurrency: int = 16,
+    timeout: float = 10,
+    update_devices: bool = False,
+    port_concurrency: int = 128,
+    port_timeout: float = 0.5,
+) -> AsyncIterator[ProbeResult]:
+    """Find hubs on network (eg: "192.168.1.0/24"), yielding results as they finish.
+
+    Each address is first checked for the websocket and serial ports being open,
+    which is cheap, and only those with both open are probed with Hub.test. Only
+    these probed hosts are yielded.
+    port_concurrency/port_timeout: limits for the port checks
+    See probe_hubs for the other arguments.
+    """
+    network = ipaddress.ip_network(network, strict=False)
+    port_semaphore = asyncio.Semaphore(port_concurrency)
+    probe_semaphore = asyncio.Semaphore(concurrency)
+
+    async def check_and_probe(host: str) -> Optional[ProbeResult]:
+        async with port_semaphore:
+            ports = await asyncio.gather(
+                port_open(host, WEBSOCKET_PORT, port_timeout),
+                port_open(host, SERIAL_PORT, port_timeout),
+            )
+        if not all(ports):
+            return None
+        async with probe_semaphore:
+            return await probe_hub(host, timeout, update_devices)
+
+    tasks = [
+        asyncio.create_task(check_and_probe(str(host))) for host in network.hosts()
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result is not None:
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -29,3 +29,9 @@ class InvalidResponseException(HubBaseException):
     """Exception thrown when an invalid response is received."""
 
     pass
+
+
+class QueueFullException(HubBaseException):
+    """Exception thrown when the outbound queue of the hub is full."""
+
+    pass
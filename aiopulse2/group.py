@@ -0,0 +1,63 @@
+"""A group of hubs, with lookups across all of their rollers."""
+
+from typing import Any, Dict, List, Optional
+
+from .devices import Hub, Roller
+from .index import RollerIndex
+
+
+class HubGroup:
+    """Several hubs, with their rollers indexed by name, type and room."""
+
+    def __init__(self):
+        """Init an empty group."""
+        self.hubs: Dict[str, Hub] = {}
+        self.index = RollerIndex()
+
+    def add(self, hub: Hub):
+        """Add hub to the group, by its host."""
+        if hub.host in self.hubs:
+            self.remove(self.hubs[hub.host])
+        self.hubs[hub.host] = hub
+        for roller in hub.rollers.values():
+            self.index.add(roller)
+        hub.index_callbacks.append(self.reindex)
+
+    def remove(self, hub: Hub):
+        """Remove hub, and its rollers, from the group."""
+        if self.hubs.get(hub.host) is not hub:
+            return
+        del self.hubs[hub.host]
+        hub.index_callbacks.remove(self.reindex)
+        for roller in hub.rollers.values():
+            self.index.remove(roller)
+
+    def reindex(self, roller: Roller, attr: str, old: Any, new: Any):
+        """Index callback of each of the hubs."""
+        self.index.update(roller, attr, old, new)
+
+    @property
+    def rollers(self) -> List[Roller]:
+        """All of the rollers on all of the hubs."""
+        return [roller for hub in self.hubs.values() for roller in hub.rollers.values()]
+
+    def get_roller(self, name: str) -> Optional[Roller]:
+        """Returns the roller called name on any hub, or None if unknown."""
+        return self.index.get_roller(name)
+
+    async def wait_for_roller(
+        self, name: str, timeout: Optional[float] = None
+    ) -> Roller:
+        """Returns the roller called name, waiting until it's discovered.
+
+        Raises asyncio.TimeoutError if not discovered within timeout seconds.
+        """
+        return await self.index.wait_for_roller(name, timeout)
+
+    def rollers_of_type(self, devicetypeshort: str) -> List[Roller]:
+        """Returns the rollers with the single letter type, see const.TYPES."""
+        return self.index.find("devicetypeshort", devicetypeshort)
+
+    def rollers_in_room(self, room: str) -> List[Roller]:
+        """Returns the rollers that have been assigned to room."""
+        return self.index.find("room", room)
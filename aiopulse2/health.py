@@ -0,0 +1,114 @@
+"""Detection of rollers that have stopped reporting."""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from .const import HealthStatus
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Tracks when each roller of a hub last reported, requesting details as needed.
+
+    A roller is:
+    - offline if the hub reports it as offline
+    - suspect if the shadow has not included its voltage for voltage_missing_after
+    - stale if none of its values have changed for stale_after
+    - otherwise ok
+    Suspect and stale rollers have a details query sent, at most once per
+    requery_interval each.
+    """
+
+    def __init__(
+        self,
+        hub,
+        stale_after: float = 6 * 3600,
+        voltage_missing_after: float = 3600,
+        requery_interval: float = 3600,
+    ):
+        """Init the monitor for hub, times are in seconds."""
+        self.hub = hub
+        self.stale_after = stale_after
+        self.voltage_missing_after = voltage_missing_after
+        self.requery_interval = requery_interval
+        self.first_seen: Dict[str, float] = {}
+        self.last_changed: Dict[str, float] = {}
+        self.last_voltage: Dict[str, float] = {}
+        self.last_query: Dict[str, float] = {}
+
+    def record(
+        self,
+        rollerid: str,
+        changed: bool,
+        has_voltage: bool,
+        now: Optional[float] = None,
+    ):
+        """Record a shadow update of rollerid."""
+        if now is None:
+            now = time.time()
+        self.first_seen.setdefault(rollerid, now)
+        if changed or rollerid not in self.last_changed:
+            self.last_changed[rollerid] = now
+        if has_voltage:
+            self.last_voltage[rollerid] = now
+
+    def record_query(self, rollerid: str, now: Optional[float] = None):
+        """Record that a details query has been sent for rollerid."""
+        self.last_query[rollerid] = time.time() if now is None else now
+
+    def status(self, rollerid: str, now: Optional[float] = None) -> HealthStatus:
+        """Returns the current status of rollerid."""
+        if now is None:
+            now = time.time()
+        roller = self.hub.rollers[rollerid]
+        if not roller.online:
+            return HealthStatus.offline
+        voltage_seen = self.last_voltage.get(rollerid, self.first_seen.get(rollerid))
+        if voltage_seen is not None and now - voltage_seen > self.voltage_missing_after:
+            return HealthStatus.suspect
+        changed = self.last_changed.get(rollerid)
+        if changed is not None and now - changed > self.stale_after:
+            return HealthStatus.stale
+        return HealthStatus.ok
+
+    def check(self, now: Optional[float] = None) -> List[str]:
+        """Send a details query for suspect and stale rollers that are due one.
+
+        Returns the ids of the rollers queried.
+        """
+        if now is None:
+            now = time.time()
+        queried = []
+        for rollerid in list(self.hub.rollers):
+            if self.status(rollerid, now) not in (
+                HealthStatus.suspect,
+                HealthStatus.stale,
+            ):
+                continue
+            if now - self.last_query.get(rollerid, 0) < self.requery_interval:
+                continue
+            _LOGGER.debug("%s: Requesting details of %s", self.hub.host, rollerid)
+            self.hub.queue_details_request(rollerid)
+            self.record_query(rollerid, now)
+            queried.append(rollerid)
+        return queried
+
+    def summary(self, now: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Returns the health of each roller, by roller id.
+
+        Each is a dict with the status and the times (or None) the roller was last
+        changed, last reported its voltage and last had a details query sent.
+        """
+        if now is None:
+            now = time.time()
+        return {
+            rollerid: {
+                "status": self.status(rollerid, now),
+                "last_changed": self.last_changed.get(rollerid),
+                "last_voltage": self.last_voltage.get(rollerid),
+                "last_query": self.last_query.get(rollerid),
+            }
+            for rollerid in self.hub.rollers
+        }
@@ -0,0 +1,73 @@
+"""Maintained lookups of rollers by their attributes."""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+# The roller attributes that are indexed
+INDEXED_ATTRIBUTES = ("name", "devicetypeshort", "room")
+
+
+class RollerIndex:
+    """Rollers indexed by name, device type and room.
+
+    The owner must call update() whenever an indexed attribute changes, Roller does
+    this for the hub it belongs to.
+    """
+
+    def __init__(self):
+        """Init an empty index."""
+        # attribute -> value -> rollers (as an ordered set)
+        self.indexes: Dict[str, Dict[Any, Dict[Any, None]]] = {
+            attr: {} for attr in INDEXED_ATTRIBUTES
+        }
+        self.name_waiters: Dict[str, asyncio.Event] = {}
+
+    def add(self, roller):
+        """Index all of the attributes of roller."""
+        for attr in INDEXED_ATTRIBUTES:
+            self.update(roller, attr, None, getattr(roller, attr))
+
+    def remove(self, roller):
+        """Remove roller from all of the indexes."""
+        for attr in INDEXED_ATTRIBUTES:
+            self.update(roller, attr, getattr(roller, attr), None)
+
+    def update(self, roller, attr: str, old: Any, new: Any):
+        """Move roller from the old to the new value of attr."""
+        index = self.indexes[attr]
+        if old is not None and old in index:
+            index[old].pop(roller, None)
+            if not index[old]:
+                del index[old]
+        if new is not None:
+            index.setdefault(new, {})[roller] = None
+            if attr == "name" and new in self.name_waiters:
+                self.name_waiters.pop(new).set()
+
+    def find(self, attr: str, value: Any) -> List:
+        """Returns all rollers where attr is value."""
+        return list(self.indexes[attr].get(value, ()))
+
+    def get_roller(self, name: str):
+        """Returns the roller called name, or None if there is no such roller.
+
+        If several rollers have the same name, the first one named is returned.
+        """
+        rollers = self.indexes["name"].get(name)
+        if rollers:
+            return next(iter(rollers))
+        return None
+
+    async def wait_for_roller(self, name: str, timeout: Optional[float] = None):
+        """Returns the roller called name, waiting for it if not yet known.
+
+        Raises asyncio.TimeoutError if not known within timeout seconds.
+        """
+        async with asyncio.timeout(timeout):
+            while True:
+                roller = self.get_roller(name)
+                if roller is not None:
+                    return roller
+                if name not in self.name_waiters:
+                    self.name_waiters[name] = asyncio.Event()
+                await self.name_waiters[name].wait()
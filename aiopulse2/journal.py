@@ -0,0 +1,219 @@
+"""Append only journal of hub state and commands, for fast recovery on restart."""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .const import MovingAction
+from .snapshot import HubSnapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+# Moves not acknowledged within this many seconds are not resent on restart, the
+# roller moving long after it was asked to would be a surprise
+RESEND_MAX_AGE = 300
+
+# Record types
+RECORD_HUB = "h"
+RECORD_ROLLER = "s"
+RECORD_COMMAND = "c"
+RECORD_ACK = "a"
+
+
+def encodevalue(value: Any) -> Any:
+    if isinstance(value, MovingAction):
+        return value.name
+    return value
+
+
+def decodevalues(values: Dict[str, Any]) -> Dict[str, Any]:
+    if "action" in values:
+        values["action"] = MovingAction[values["action"]]
+    return values
+
+
+class StateJournal:
+    """Journal of the changes applied to a hub and the moves sent to it.
+
+    Each line of the file is a JSON record. When the hub restarts with the same
+    journal, the last known state is restored straight away, and moves that were
+    not acknowledged are reconciled against the first shadow from the hub: resent if
+    the roller is not there (or moving there) yet.
+
+    path: the file to use, a journal (and its file) is for one hub only
+    compact_after: rewrite the file with just the current state after this many
+        records have been appended
+    """
+
+    def __init__(self, path: str, compact_after: int = 1000):
+        """Init the journal, the file is opened by the Hub."""
+        self.path = path
+        self.compact_after = compact_after
+        self.host: Optional[str] = None
+        self.file = None
+        self.records = 0
+        self.last: Optional[HubSnapshot] = None
+        self.next_command = 1
+        # The unacknowledged move of each roller: (command number, percent, time)
+        self.pending: Dict[str, Tuple[int, int, float]] = {}
+        # The pending moves restored from the file, to reconcile
+        self.restored: Dict[str, Tuple[int, int, float]] = {}
+
+    def write(self, record: Dict[str, Any]):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.records += 1
+
+    def flush(self, snapshot: HubSnapshot):
+        self.file.flush()
+        if self.records >= self.compact_after:
+            self.compact(snapshot)
+
+    def restore(self, hub) -> bool:
+        """Rebuild the state of hub from the journal, and open it for appending.
+
+        Returns True if any rollers were restored.
+        Raises ValueError if the journal is already in use by another hub.
+        """
+        if self.host is not None:
+            raise ValueError(
+                f"Journal {self.path} is already used by {self.host}, give each hub "
+                "its own journal (such as a path with {host})"
+            )
+        self.host = hub.host
+        hubvalues: Dict[str, Any] = {}
+        rollers: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Most likely the last line, partly written when it stopped
+                        _LOGGER.debug("%s: Invalid journal line: %r", hub.host, line)
+                        continue
+                    kind = record.get("k")
+                    if kind == RECORD_HUB:
+                        hubvalues.update(record["v"])
+                    elif kind == RECORD_ROLLER:
+                        rollers.setdefault(record["r"], {}).update(record["v"])
+                    elif kind == RECORD_COMMAND:
+                        self.pending[record["r"]] = (
+                            record["n"],
+                            record["p"],
+                            record["t"],
+                        )
+                        self.next_command = record["n"] + 1
+                    elif kind == RECORD_ACK:
+                        if self.pending.get(record["r"], (None,))[0] == record["n"]:
+                            del self.pending[record["r"]]
+        self.restored = dict(self.pending)
+        hubvalues.pop("connected", None)
+        hub.applychanges(hub, hubvalues)
+        for rollerid, values in rollers.items():
+            hub.restore_roller(rollerid, decodevalues(values))
+        self.last = hub.snapshot()
+        self.file = open(self.path, "a")
+        self.compact(self.last)
+        return bool(rollers)
+
+    def compact(self, snapshot: HubSnapshot):
+        """Rewrite the journal with only the current state and pending moves."""
+        tmppath = self.path + ".tmp"
+        with open(tmppath, "w") as f:
+            self.file.close()
+            self.file = f
+            self.records = 0
+            self.write_snapshot(snapshot, None)
+            for rollerid, (number, percent, sent) in self.pending.items():
+                self.write(
+                    {
+                        "k": RECORD_COMMAND,
+                        "n": number,
+                        "r": rollerid,
+                        "p": percent,
+                        "t": sent,
+                    }
+                )
+        os.replace(tmppath, self.path)
+        self.file = open(self.path, "a")
+
+    def write_snapshot(self, snapshot: HubSnapshot, older: Optional[HubSnapshot]):
+        """Write the changes from older to snapshot."""
+        changes = snapshot.diff(older)
+        if changes["hub"]:
+            self.write({"k": RECORD_HUB, "v": changes["hub"]})
+        for rollerid, values in changes["rollers"].items():
+            values = {field: encodevalue(value) for field, value in values.items()}
+            values.pop("id", None)
+            self.write({"k": RECORD_ROLLER, "r": rollerid, "v": values})
+
+    def record(self, snapshot: HubSnapshot):
+        """Record the changes since the last snapshot recorded."""
+        if self.file is None or snapshot is self.last:
+            return
+        self.write_snapshot(snapshot, self.last)
+        for rollerid, (number, percent, _) in list(self.pending.items()):
+            roller = snapshot.rollers.get(rollerid)
+            if roller is not None and roller.closed_percent == percent:
+                self.acknowledge(rollerid, number)
+        self.last = snapshot
+        self.flush(snapshot)
+
+    def record_command(self, rollerid: str, percent: int):
+        """Record a move sent to rollerid."""
+        if self.file is None:
+            return
+        number = self.next_command
+        self.next_command += 1
+        sent = time.time()
+        self.pending[rollerid] = (number, percent, sent)
+        self.write(
+            {"k": RECORD_COMMAND, "n": number, "r": rollerid, "p": percent, "t": sent}
+        )
+
+    def acknowledge(self, rollerid: str, number: int):
+        """Record that the move number of rollerid needs no further action."""
+        if self.pending.get(rollerid, (None,))[0] != number:
+            return
+        del self.pending[rollerid]
+        self.write({"k": RECORD_ACK, "n": number, "r": rollerid})
+
+    def reconcile(self, hub):
+        """Compare the restored moves against the first shadow, resending if needed.
+
+        Only the moves restored from the file are reconciled, moves sent since are
+        tracked as normal.
+        """
+        now = time.time()
+        restored, self.restored = self.restored, {}
+        for rollerid, (number, percent, sent) in restored.items():
+            if self.pending.get(rollerid, (None,))[0] != number:
+                # Already acknowledged, or replaced by a newer move
+                continue
+            roller = hub.rollers.get(rollerid)
+            self.acknowledge(rollerid, number)
+            if roller is None or roller.closed_percent == percent or roller.moving:
+                continue
+            if now - sent > RESEND_MAX_AGE:
+                _LOGGER.info(
+                    "%s: Not resending old move of %s to %s",
+                    hub.host,
+                    rollerid,
+                    percent,
+                )
+                continue
+            _LOGGER.info("%s: Resending move of %s to %s", hub.host, rollerid, percent)
+            hub.async_add_job(roller.move_to, percent)
+        self.file.flush()
+
+    def reopen(self):
+        """Reopen the journal for appending after close(), once restored."""
+        if self.file is None and self.host is not None:
+            self.file = open(self.path, "a")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,123 @@
+"""Rate limiting of the commands sent to a hub, to avoid flooding the RF network."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class CommandLimiter:
+    """Token bucket limiter for the commands of one hub.
+
+    Up to burst commands are sent straight away, after that commands are sent at
+    rate per second. Waiting commands are queued by key (normally the roller id),
+    and sent round robin, so one busy roller or caller can't hold up the others. A
+    new command for a key that already has a command waiting replaces it, as only
+    the latest command for a roller matters: both callers are done once it is sent.
+    """
+
+    def __init__(self, rate: float, burst: int = 5):
+        """Init the limiter.
+
+        rate: the commands per second sent once the burst is used up
+        burst: the number of commands that can be sent at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # key: [send, futures waiting on it, time queued]
+        self.queue: "OrderedDict[Hashable, List[Any]]" = OrderedDict()
+        self.task: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.merged = 0
+        self.delayed = 0
+        self.last_delay = 0.0
+        self.max_delay = 0.0
+        self.total_delay = 0.0
+
+    @property
+    def depth(self) -> int:
+        """The number of commands waiting to be sent."""
+        return len(self.queue)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def submit(self, key: Hashable, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Run send() once allowed, returning its result.
+
+        key: commands with the same key are merged while waiting
+        """
+        self.refill()
+        if not self.queue and self.tokens >= 1:
+            self.tokens -= 1
+            self.record_delay(0.0)
+            return await send()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = self.queue.get(key)
+        if entry is None:
+            self.queue[key] = [send, [future], time.monotonic()]
+        else:
+            # Keeps its place in the queue, with the latest command
+            entry[0] = send
+            entry[1].append(future)
+            self.merged += 1
+        self.delayed += 1
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self.run())
+        return await future
+
+    async def run(self):
+        """Send the queued commands as tokens become available."""
+        while self.queue:
+            key, (send, futures, queued) = next(iter(self.queue.items()))
+            if all(future.done() for future in futures):
+                # All callers have given up (cancelled)
+                del self.queue[key]
+                continue
+            self.refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            self.tokens -= 1
+            # Taken from the queue at the last moment, so later commands still merge
+            send, futures, queued = self.queue.pop(key)
+            self.record_delay(time.monotonic() - queued)
+            try:
+                result = await send()
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in futures:
+                    if not future.done():
+                        future.set_result(result)
+
+    def record_delay(self, delay: float):
+        self.sent += 1
+        self.last_delay = delay
+        self.max_delay = max(self.max_delay, delay)
+        self.total_delay += delay
+
+    def metrics(self) -> Dict[str, Any]:
+        """Returns the queue depth, and counts and delays (in seconds) of commands.
+
+        sent includes merged commands only once, and the delays are from when each
+        command was first queued.
+        """
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "delayed": self.delayed,
+            "merged": self.merged,
+            "last_delay": self.last_delay,
+            "max_delay": self.max_delay,
+            "average_delay": self.total_delay / self.sent if self.sent else 0.0,
+        }
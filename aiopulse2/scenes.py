@@ -0,0 +1,148 @@
+"""Named sets of roller positions (scenes), across the hubs of a HubGroup."""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+
+from .const import CommandStatus
+from .devices import Hub, Roller
+from .group import HubGroup
+from .tracking import TrackedCommand
+
+_LOGGER = logging.getLogger(__name__)
+
+# The positions of a scene: the percent closed of each roller, by host then roller
+Positions = Dict[str, Dict[str, int]]
+
+
+class SceneRegistry:
+    """Scenes for the hubs in group.
+
+    Each scene maps the host of each hub to the percent closed of its rollers,
+    rollers are given by id or name. Applying a scene sends one combined command to
+    each hub (see Hub.move_many), to all hubs at once.
+    """
+
+    def __init__(self, group: HubGroup, scenes: Optional[Mapping[str, Any]] = None):
+        """Init the registry.
+
+        scenes: initial scenes by name, such as from as_dict()
+        """
+        self.group = group
+        self.scenes: Dict[str, Positions] = {}
+        for name, positions in (scenes or {}).items():
+            self.define(name, positions)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.scenes
+
+    def names(self) -> List[str]:
+        """Returns the names of the scenes."""
+        return list(self.scenes)
+
+    def define(self, name: str, positions: Mapping[str, Mapping[str, int]]):
+        """Add or replace the scene name, positions is by host then roller."""
+        self.scenes[name] = {
+            host: {roller: int(percent) for roller, percent in rollers.items()}
+            for host, rollers in positions.items()
+        }
+
+    def remove(self, name: str):
+        """Remove the scene name."""
+        del self.scenes[name]
+
+    def capture(self, name: str, hosts: Optional[Iterable[str]] = None) -> Positions:
+        """Define the scene name from the current position of the rollers.
+
+        hosts: the hubs to include, default is all hubs of the group
+        Rollers with an unknown position are left out. Returns the positions.
+        """
+        if hosts is None:
+            hosts = self.group.hubs
+        positions: Positions = {}
+        for host in hosts:
+            rollers = {
+                roller.id: roller.closed_percent
+                for roller in self.group.hubs[host].rollers.values()
+                if roller.closed_percent is not None
+            }
+            if rollers:
+                positions[host] = rollers
+        self.define(name, positions)
+        return self.scenes[name]
+
+    def as_dict(self) -> Dict[str, Positions]:
+        """Returns all scenes, suitable for saving as JSON."""
+        return {
+            name: {host: dict(rollers) for host, rollers in positions.items()}
+            for name, positions in self.scenes.items()
+        }
+
+    def resolve(self, name: str) -> Dict[Hub, Dict[str, int]]:
+        """Returns the positions of scene name by Hub and roller id.
+
+        Raises KeyError if the scene, or any of its hubs or rollers, are unknown.
+        """
+        resolved: Dict[Hub, Dict[str, int]] = {}
+        for host, rollers in self.scenes[name].items():
+            hub = self.group.hubs.get(host)
+            if hub is None:
+                raise KeyError(f"Scene {name!r}: unknown hub {host}")
+            byid = resolved.setdefault(hub, {})
+            for ref, percent in rollers.items():
+                roller = hub.rollers.get(ref) or hub.get_roller(ref)
+                if roller is None:
+                    raise KeyError(f"Scene {name!r}: unknown roller {ref!r} on {host}")
+                byid[roller.id] = percent
+        return resolved
+
+    async def send(self, name: str) -> Dict[Roller, TrackedCommand]:
+        """Send the commands of scene name, returns the command of each roller.
+
+        Everything is looked up before anything is sent, so a scene with an
+        unknown hub or roller (KeyError) moves nothing.
+        """
+        resolved = self.resolve(name)
+        results = await asyncio.gather(
+            *(hub.move_many(positions) for hub, positions in resolved.items())
+        )
+        return {
+            hub.rollers[rollerid]: command
+            for hub, commands in zip(resolved, results)
+            for rollerid, command in commands.items()
+        }
+
+    async def apply(
+        self,
+        name: str,
+        timeout: Optional[float] = None,
+        on_complete: Optional[Callable[[Roller, CommandStatus], Any]] = None,
+    ) -> Dict[Roller, CommandStatus]:
+        """Apply scene name, and wait until each roller is finished.
+
+        timeout: seconds to wait for the rollers to finish
+        on_complete: called with each roller and its final CommandStatus, as each
+            finishes
+        Returns the status of each roller, rollers not finished in timeout are left
+        at their current status (sent or acked).
+        """
+        commands = await self.send(name)
+
+        async def wait(roller: Roller, command: TrackedCommand):
+            status = await command.wait()
+            if on_complete is not None:
+                roller.hub.async_add_job(on_complete, roller, status)
+
+        waiters = [
+            asyncio.ensure_future(wait(roller, command))
+            for roller, command in commands.items()
+        ]
+        if waiters:
+            _, notdone = await asyncio.wait(waiters, timeout=timeout)
+            for waiter in notdone:
+                waiter.cancel()
+            if notdone:
+                _LOGGER.info(
+                    "Scene %r: %d rollers not finished in time", name, len(notdone)
+                )
+        return {roller: command.status for roller, command in commands.items()}
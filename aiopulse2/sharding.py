@@ -0,0 +1,342 @@
+"""Hubs spread over worker processes, for controllers with many hubs.
+
+Each worker process runs its share of the Hub instances on its own event loop, and
+streams the changes of the hub and roller state to the parent process. The parent
+holds a copy of the state with the same read API as Hub and Roller, and sends
+commands to the worker that owns the hub.
+
+Messages are marshal encoded lists, so each read of the pipe handles every change
+made during one pass of the worker's event loop.
+"""
+
+import asyncio
+import logging
+import marshal
+import multiprocessing
+import signal
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .const import MovingAction
+from .devices import Hub, Roller
+from .index import INDEXED_ATTRIBUTES, RollerIndex
+from .snapshot import HUB_STATE_FIELDS, ROLLER_STATE_FIELDS
+
+_LOGGER = logging.getLogger(__name__)
+
+# Message types, worker to parent
+MSG_HUB = "h"
+MSG_ROLLER = "r"
+MSG_KNOWN = "k"
+# Message types, parent to worker
+MSG_MOVE = "m"
+MSG_MOVE_MANY = "M"
+MSG_STOP_ROLLER = "s"
+MSG_STOP = "q"
+
+
+def encodefield(value: Any) -> Any:
+    """Make value suitable for marshal."""
+    if isinstance(value, MovingAction):
+        return value.name
+    return value
+
+
+class ShardWorker:
+    """The hubs in a worker process, streaming their changes to the parent."""
+
+    def __init__(self, hosts: List[str], hub_kwargs: Dict[str, Any], conn):
+        """Init the worker, connecting to the parent with conn."""
+        self.conn = conn
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.pending: List[tuple] = []
+        # The last state sent, by host and (host, roller id)
+        self.sent: Dict[Any, Dict[str, Any]] = {}
+        self.known = set()
+        hub_kwargs = dict(hub_kwargs)
+        # All changes are streamed, the parent does its own callback handling
+        hub_kwargs["delay_callbacks"] = False
+        self.hubs = {host: Hub(host, **hub_kwargs) for host in hosts}
+        for hub in self.hubs.values():
+            hub.callback_subscribe(self.hub_update)
+
+    def queue(self, msg: tuple):
+        """Send msg with the next batch."""
+        if not self.pending:
+            self.loop.call_soon(self.flush)
+        self.pending.append(msg)
+
+    def flush(self):
+        try:
+            self.conn.send_bytes(marshal.dumps(self.pending))
+        except (BrokenPipeError, OSError):
+            self.stopped.set()
+        self.pending = []
+
+    def delta(self, key: Any, obj: Any, fields: Iterable[str]) -> Dict[str, Any]:
+        """Returns the fields of obj that have changed since last sent."""
+        last = self.sent.setdefault(key, {})
+        changes = {}
+        for field in fields:
+            value = encodefield(getattr(obj, field))
+            if field not in last or last[field] != value:
+                last[field] = value
+                changes[field] = value
+        return changes
+
+    async def hub_update(self, hub: Hub):
+        changes = self.delta(hub.host, hub, HUB_STATE_FIELDS)
+        if changes:
+            self.queue((MSG_HUB, hub.host, changes))
+        for roller in hub.rollers.values():
+            roller.callback_subscribe(self.roller_update)
+            await self.roller_update(roller)
+        if hub.rollers_known.is_set() and hub.host not in self.known:
+            self.known.add(hub.host)
+            self.queue((MSG_KNOWN, hub.host))
+
+    async def roller_update(self, roller: Roller):
+        changes = self.delta((roller.hub.host, roller.id), roller, ROLLER_STATE_FIELDS)
+        if changes:
+            self.queue((MSG_ROLLER, roller.hub.host, roller.id, changes))
+
+    def receive(self):
+        """Handle commands from the parent."""
+        try:
+            msgs = marshal.loads(self.conn.recv_bytes())
+        except (EOFError, OSError):
+            self.stopped.set()
+            return
+        for msg in msgs:
+            if msg[0] == MSG_STOP:
+                self.stopped.set()
+                continue
+            hub = self.hubs[msg[1]]
+            if msg[0] == MSG_MOVE:
+                self.loop.create_task(hub.rollers[msg[2]].move_to(msg[3]))
+            elif msg[0] == MSG_MOVE_MANY:
+                self.loop.create_task(hub.move_many(msg[2]))
+            elif msg[0] == MSG_STOP_ROLLER:
+                self.loop.create_task(hub.rollers[msg[2]].move_stop())
+
+    async def run(self):
+        """Run the hubs until the parent sends stop, or goes away."""
+        self.loop.add_reader(self.conn.fileno(), self.receive)
+        for hub in self.hubs.values():
+            self.loop.create_task(hub.run())
+        await self.stopped.wait()
+        self.loop.remove_reader(self.conn.fileno())
+        for hub in self.hubs.values():
+            await hub.stop()
+
+
+def worker_main(hosts: List[str], hub_kwargs: Dict[str, Any], conn):
+    """Entry point of the worker processes."""
+    # The parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    async def main():
+        await ShardWorker(hosts, hub_kwargs, conn).run()
+
+    asyncio.run(main())
+
+
+class RollerProxy:
+    """The state of a Roller in a worker, with the same read API."""
+
+    __slots__ = ("hub", "id", "update_callbacks") + tuple(
+        "_" + field if field in INDEXED_ATTRIBUTES else field
+        for field in ROLLER_STATE_FIELDS
+    )
+
+    def __init__(self, hub: "HubProxy", roller_id: str):
+        """Init an empty roller."""
+        self.hub = hub
+        self.id = roller_id
+        self.update_callbacks: List[Callable] = []
+        for field in self.__slots__[3:]:
+            setattr(self, field, None)
+        self.moving = False
+        self.online = False
+        self.action = MovingAction.stopped
+
+    __str__ = Roller.__str__
+    battery_percent = Roller.battery_percent
+    has_battery = Roller.has_battery
+    callback_subscribe = Roller.callback_subscribe
+    callback_unsubscribe = Roller.callback_unsubscribe
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def devicetypeshort(self):
+        return self._devicetypeshort
+
+    @property
+    def room(self):
+        return self._room
+
+    def apply(self, changes: Dict[str, Any]):
+        """Apply the changes sent from the worker."""
+        for field, value in changes.items():
+            if field == "action":
+                value = MovingAction[value]
+            if field in INDEXED_ATTRIBUTES:
+                old = getattr(self, "_" + field)
+                setattr(self, "_" + field, value)
+                self.hub.index.update(self, field, old, value)
+            else:
+                setattr(self, field, value)
+        for callback in self.update_callbacks:
+            self.hub.shards.async_add_job(callback, self)
+
+    async def move_to(self, percent: int):
+        """Send command to move the roller to a percentage closed."""
+        self.hub.send((MSG_MOVE, self.hub.host, self.id, int(percent)))
+
+    async def move_up(self):
+        """Send command to move the roller to fully open."""
+        await self.move_to(0)
+
+    async def move_down(self):
+        """Send command to move the roller to fully closed."""
+        await self.move_to(100)
+
+    async def move_stop(self):
+        """Send command to stop the roller."""
+        self.hub.send((MSG_STOP_ROLLER, self.hub.host, self.id))
+
+
+class HubProxy:
+    """The state of a Hub in a worker, with the same read API."""
+
+    def __init__(self, shards: "ShardedHubs", host: str, worker: int):
+        """Init an empty hub."""
+        self.shards = shards
+        self.host = host
+        self.worker = worker
+        for field in HUB_STATE_FIELDS:
+            setattr(self, field, None)
+        self.connected = False
+        self.rollers: Dict[str, RollerProxy] = {}
+        self.rollers_known = asyncio.Event()
+        self.index = RollerIndex()
+        self.update_callbacks: List[Callable] = []
+
+    __str__ = Hub.__str__
+    callback_subscribe = Hub.callback_subscribe
+    callback_unsubscribe = Hub.callback_unsubscribe
+    get_roller = Hub.get_roller
+    wait_for_roller = Hub.wait_for_roller
+    rollers_of_type = Hub.rollers_of_type
+    rollers_in_room = Hub.rollers_in_room
+
+    def send(self, msg: tuple):
+        self.shards.send(self.worker, msg)
+
+    def notify_callback(self):
+        for callback in self.update_callbacks:
+            self.shards.async_add_job(callback, self)
+
+    async def move_many(self, positions: Dict[str, int]):
+        """Move several rollers at once, see Hub.move_many."""
+        positions = {rollerid: int(percent) for rollerid, percent in positions.items()}
+        self.send((MSG_MOVE_MANY, self.host, positions))
+
+
+class ShardedHubs:
+    """Hubs run in worker processes.
+
+    hosts: the hubs to connect to
+    workers: the number of worker processes, default is the number of CPUs
+    hub_kwargs: extra arguments for each Hub
+    """
+
+    def __init__(
+        self,
+        hosts: Iterable[str],
+        workers: Optional[int] = None,
+        hub_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        """Init the hubs, call start() to start the workers."""
+        hosts = list(hosts)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.nworkers = max(1, min(workers, len(hosts)))
+        self.hub_kwargs = hub_kwargs or {}
+        self.hubs: Dict[str, HubProxy] = {
+            host: HubProxy(self, host, i % self.nworkers)
+            for i, host in enumerate(hosts)
+        }
+        self.processes: List[multiprocessing.Process] = []
+        self.conns: List[Any] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        """Start the worker processes."""
+        self.loop = asyncio.get_running_loop()
+        ctx = multiprocessing.get_context("spawn")
+        for worker in range(self.nworkers):
+            hosts = [hub.host for hub in self.hubs.values() if hub.worker == worker]
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=worker_main,
+                args=(hosts, self.hub_kwargs, child_conn),
+                name=f"aiopulse2-shard-{worker}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self.processes.append(process)
+            self.conns.append(parent_conn)
+            self.loop.add_reader(parent_conn.fileno(), self.receive, worker)
+
+    async def stop(self):
+        """Stop the worker processes, and wait for them to exit."""
+        for worker, conn in enumerate(self.conns):
+            self.loop.remove_reader(conn.fileno())
+            self.send(worker, (MSG_STOP,))
+        for process in self.processes:
+            await self.loop.run_in_executor(None, process.join)
+        for conn in self.conns:
+            conn.close()
+        self.processes = []
+        self.conns = []
+
+    def send(self, worker: int, msg: tuple):
+        try:
+            self.conns[worker].send_bytes(marshal.dumps([msg]))
+        except (BrokenPipeError, OSError) as e:
+            _LOGGER.warning("Unable to send to shard %d: %s", worker, e)
+
+    def async_add_job(self, target: Callable[..., Any], *args: Any):
+        """Run a callback, see Hub.async_add_job."""
+        return Hub.async_add_job(self, target, *args)
+
+    def receive(self, worker: int):
+        """Apply the changes from worker."""
+        conn = self.conns[worker]
+        try:
+            msgs = marshal.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+            _LOGGER.warning("Shard %d has exited", worker)
+            self.loop.remove_reader(conn.fileno())
+            return
+        updated = set()
+        for msg in msgs:
+            hub = self.hubs[msg[1]]
+            if msg[0] == MSG_HUB:
+                for field, value in msg[2].items():
+                    setattr(hub, field, value)
+                updated.add(hub)
+            elif msg[0] == MSG_ROLLER:
+                if msg[2] not in hub.rollers:
+                    hub.rollers[msg[2]] = RollerProxy(hub, msg[2])
+                    updated.add(hub)
+                hub.rollers[msg[2]].apply(msg[3])
+            elif msg[0] == MSG_KNOWN:
+                hub.rollers_known.set()
+        for hub in updated:
+            hub.notify_callback()
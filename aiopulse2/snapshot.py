@@ -0,0 +1,94 @@
+"""Immutable point in time views of a hub and its rollers."""
+
+from collections import namedtuple
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+# The attributes that make up the state of a hub and roller, as seen by consumers
+HUB_STATE_FIELDS = ("name", "id", "mac_address", "firmware_ver", "model", "connected")
+ROLLER_STATE_FIELDS = (
+    "name",
+    "devicetypeshort",
+    "devicetype",
+    "battery",
+    "target_closed_percent",
+    "closed_percent",
+    "tilt_percent",
+    "signal",
+    "version",
+    "moving",
+    "action",
+    "online",
+    "room",
+)
+
+HubState = namedtuple("HubState", HUB_STATE_FIELDS)
+RollerState = namedtuple("RollerState", ("id",) + ROLLER_STATE_FIELDS)
+
+
+class HubSnapshot:
+    """The state of a hub and all of its rollers at one point in time.
+
+    version: the hub generation the snapshot was taken at, this increases with each
+        change to the hub or any roller
+    hub: the HubState
+    rollers: a read only mapping of roller id to RollerState
+
+    The RollerState of rollers that have not changed is shared between snapshots,
+    which keeps taking a snapshot and diff() cheap.
+    """
+
+    __slots__ = ("host", "version", "hub", "rollers")
+
+    def __init__(
+        self,
+        host: str,
+        version: int,
+        hub: HubState,
+        rollers: Mapping[str, RollerState],
+    ):
+        """Init the snapshot, this is normally done with Hub.snapshot()."""
+        self.host = host
+        self.version = version
+        self.hub = hub
+        self.rollers = MappingProxyType(dict(rollers))
+
+    def __repr__(self):
+        """Returns the string representation of the snapshot."""
+        return f"<HubSnapshot {self.host} v{self.version} rollers={len(self.rollers)}>"
+
+    def diff(self, older: Optional["HubSnapshot"]) -> Dict[str, Any]:
+        """Returns what has changed since older (None for everything).
+
+        The result has:
+        hub: the hub fields that have changed, with their new values
+        rollers: the changed fields of each changed (or new) roller, by roller id
+        removed: the ids of rollers no longer present
+        """
+        changes: Dict[str, Any] = {"hub": {}, "rollers": {}, "removed": []}
+        if older is self:
+            return changes
+        if older is None or older.hub is not self.hub:
+            changes["hub"] = fieldchanges(older and older.hub, self.hub)
+        oldrollers = older.rollers if older is not None else {}
+        for rollerid, state in self.rollers.items():
+            oldstate = oldrollers.get(rollerid)
+            if oldstate is not state:
+                rollerchanges = fieldchanges(oldstate, state)
+                if rollerchanges:
+                    changes["rollers"][rollerid] = rollerchanges
+        changes["removed"] = [
+            rollerid for rollerid in oldrollers if rollerid not in self.rollers
+        ]
+        return changes
+
+
+def fieldchanges(old: Optional[tuple], new: tuple) -> Dict[str, Any]:
+    """Returns the fields of the namedtuple new that differ from old."""
+    if old is None:
+        return new._asdict()
+    return {
+        field: value
+        for field, value, oldvalue in zip(new._fields, new, old)
+        if value != oldvalue
+    }
@@ -0,0 +1,195 @@
+"""Synchronous, thread safe client, running the hubs on a background event loop."""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Callable, Dict, Mapping, Optional, Union
+
+from .devices import Hub, Roller
+from .group import HubGroup
+from .snapshot import HubSnapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+# A roller may be given as the Roller, or by its name
+RollerRef = Union[Roller, str]
+
+
+class SyncClient:
+    """Drive hubs from non-async code.
+
+    The client owns an event loop running in a background thread, all hubs run on
+    this. Methods may be called from any thread; those ending in _future return a
+    concurrent.futures.Future, the others block until complete.
+
+    A snapshot of each hub is published after each change, so snapshot() does not
+    need to go through the event loop.
+    """
+
+    def __init__(self, hub_kwargs: Optional[Dict[str, Any]] = None):
+        """Init the client and start the event loop thread.
+
+        hub_kwargs: extra arguments for each Hub
+        """
+        self.hub_kwargs = hub_kwargs or {}
+        self.group = HubGroup()
+        self.state: Mapping[str, HubSnapshot] = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="aiopulse2", daemon=True
+        )
+        self.thread.start()
+
+    @property
+    def hubs(self) -> Dict[str, Hub]:
+        """The hubs, by host."""
+        return self.group.hubs
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Run coro on the event loop, returns a Future for the result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def add_job(self, target: Callable[..., Any], *args: Any) -> None:
+        """Run target(*args) on the event loop, see Hub.async_add_job."""
+        if target is None:
+            raise ValueError("Don't call add_job with None")
+
+        def start():
+            if asyncio.iscoroutine(target):
+                self.loop.create_task(target)
+            elif asyncio.iscoroutinefunction(target):
+                self.loop.create_task(target(*args))
+            else:
+                target(*args)
+
+        self.loop.call_soon_threadsafe(start)
+
+    def connect_future(
+        self, host: str, timeout: Optional[float] = None
+    ) -> concurrent.futures.Future:
+        """Connect to the hub at host, the Future completes with the Hub once all of
+        the rollers are known."""
+        return self.submit(self.async_connect(host, timeout))
+
+    def connect(self, host: str, timeout: Optional[float] = None) -> Hub:
+        """Connect to the hub at host, and wait until all of the rollers are known."""
+        return self.connect_future(host, timeout).result()
+
+    async def async_connect(self, host: str, timeout: Optional[float] = None) -> Hub:
+        hub = self.group.hubs.get(host)
+        if hub is None:
+            hub = Hub(host, **self.hub_kwargs)
+            hub.callback_subscribe(self.hub_update)
+            self.group.add(hub)
+            self.loop.create_task(hub.run())
+        await asyncio.wait_for(hub.rollers_known.wait(), timeout)
+        return hub
+
+    def disconnect(self, host: str):
+        """Disconnect from the hub at host."""
+        self.submit(self.async_disconnect(host)).result()
+
+    async def async_disconnect(self, host: str):
+        hub = self.group.hubs.get(host)
+        if hub is None:
+            return
+        self.group.remove(hub)
+        await hub.stop()
+        state = dict(self.state)
+        state.pop(host, None)
+        self.state = state
+
+    def close(self):
+        """Disconnect from all hubs and stop the event loop thread."""
+        for host in list(self.group.hubs):
+            self.disconnect(host)
+        self.submit(self.cancel_tasks()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def cancel_tasks(self):
+        """Cancel the tasks left behind by the hubs, such as the heartbeat."""
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_roller(self, roller: RollerRef) -> Roller:
+        """Returns the Roller, looking it up by name if needed.
+
+        Raises KeyError if there is no roller with the name.
+        """
+        if isinstance(roller, Roller):
+            return roller
+        found = self.group.get_roller(roller)
+        if found is None:
+            raise KeyError(roller)
+        return found
+
+    def move_to_future(
+        self, roller: RollerRef, percent: int
+    ) -> concurrent.futures.Future:
+        """Send the command to move roller to percent closed."""
+        return self.submit(self.get_roller(roller).move_to(percent))
+
+    def move_to(self, roller: RollerRef, percent: int, timeout: Optional[float] = None):
+        """Send the command to move roller to percent closed, and wait until sent."""
+        self.move_to_future(roller, percent).result(timeout)
+
+    def move_many_future(
+        self, positions: Mapping[RollerRef, int]
+    ) -> concurrent.futures.Future:
+        """Send the commands to move each roller, with one command per hub."""
+        byhub: Dict[Hub, Dict[str, int]] = {}
+        for roller, percent in positions.items():
+            roller = self.get_roller(roller)
+            byhub.setdefault(roller.hub, {})[roller.id] = percent
+
+        async def move_many():
+            await asyncio.gather(
+                *(hub.move_many(rollers) for hub, rollers in byhub.items())
+            )
+
+        return self.submit(move_many())
+
+    def move_many(
+        self, positions: Mapping[RollerRef, int], timeout: Optional[float] = None
+    ):
+        """Send the commands to move each roller, and wait until sent."""
+        self.move_many_future(positions).result(timeout)
+
+    def move_stop_future(self, roller: RollerRef) -> concurrent.futures.Future:
+        """Send the command to stop roller."""
+        return self.submit(self.get_roller(roller).move_stop())
+
+    def move_stop(self, roller: RollerRef, timeout: Optional[float] = None):
+        """Send the command to stop roller, and wait until sent."""
+        self.move_stop_future(roller).result(timeout)
+
+    def snapshot(self) -> Mapping[str, HubSnapshot]:
+        """Returns the state of all hubs, by host, without going through the loop.
+
+        Each is the latest HubSnapshot of the hub, see Hub.snapshot().
+        """
+        return self.state
+
+    async def hub_update(self, hub: Hub):
+        """Hub callback, subscribes to the rollers and publishes the state."""
+        for roller in hub.rollers.values():
+            if self.roller_update not in roller.update_callbacks:
+                roller.callback_subscribe(self.roller_update)
+        self.publish(hub)
+
+    async def roller_update(self, roller: Roller):
+        self.publish(roller.hub)
+
+    def publish(self, hub: Hub):
+        """Replace the published state of hub with a new snapshot."""
+        if hub.host not in self.group.hubs:
+            return
+        state = dict(self.state)
+        state[hub.host] = hub.snapshot()
+        # Replacing the reference is atomic, readers see either the old or new state
+        self.state = state
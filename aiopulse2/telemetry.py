@@ -0,0 +1,173 @@
+"""Bounded history of roller telemetry (battery, signal and position)."""
+
+import time
+from array import array
+from typing import List, Optional, Tuple
+
+# Samples older than this are recorded again even if unchanged, so quiet periods
+# still appear in the history
+SAMPLE_INTERVAL = 300
+
+# (start time, minimum, maximum, average) of a downsampled bucket
+Bucket = Tuple[float, float, float, float]
+
+
+class TelemetrySeries:
+    """The history of a single value, with a fixed memory use.
+
+    The most recent samples are kept as is in a ring buffer. As samples drop out of
+    this they are folded into fixed time buckets (min/max/avg), which are also kept
+    in a ring buffer, so older data is kept at a lower resolution.
+    """
+
+    def __init__(self, size: int = 256, buckets: int = 168, bucket_seconds=3600):
+        """Init the series.
+
+        size: the number of raw samples kept
+        buckets: the number of downsampled buckets kept
+        bucket_seconds: the time covered by each bucket
+        """
+        self.size = size
+        self.times = array("d", bytes(8 * size))
+        self.values = array("d", bytes(8 * size))
+        self.count = 0
+        self.next = 0
+
+        self.nbuckets = buckets
+        self.bucket_seconds = bucket_seconds
+        self.bucket_start = array("d", bytes(8 * buckets))
+        self.bucket_min = array("d", bytes(8 * buckets))
+        self.bucket_max = array("d", bytes(8 * buckets))
+        self.bucket_sum = array("d", bytes(8 * buckets))
+        self.bucket_count = array("L", bytes(array("L").itemsize * buckets))
+        self.buckets_used = 0
+        self.bucket_next = 0
+
+    def __len__(self):
+        """The number of raw samples held."""
+        return self.count
+
+    def add(self, value: float, timestamp: Optional[float] = None):
+        """Record value, at timestamp (default now)."""
+        if timestamp is None:
+            timestamp = time.time()
+        if self.count == self.size:
+            # Full, the oldest sample is about to be overwritten
+            self.fold(self.times[self.next], self.values[self.next])
+        else:
+            self.count += 1
+        self.times[self.next] = timestamp
+        self.values[self.next] = value
+        self.next = (self.next + 1) % self.size
+
+    def fold(self, timestamp: float, value: float):
+        """Add a sample to the downsampled buckets."""
+        start = timestamp - timestamp % self.bucket_seconds
+        last = (self.bucket_next - 1) % self.nbuckets
+        if self.buckets_used and self.bucket_start[last] >= start:
+            # Same bucket as the last sample (or the clock went backwards)
+            self.bucket_min[last] = min(self.bucket_min[last], value)
+            self.bucket_max[last] = max(self.bucket_max[last], value)
+            self.bucket_sum[last] += value
+            self.bucket_count[last] += 1
+            return
+        i = self.bucket_next
+        self.bucket_start[i] = start
+        self.bucket_min[i] = value
+        self.bucket_max[i] = value
+        self.bucket_sum[i] = value
+        self.bucket_count[i] = 1
+        self.bucket_next = (i + 1) % self.nbuckets
+        self.buckets_used = min(self.buckets_used + 1, self.nbuckets)
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        """Returns the most recent (timestamp, value), or None if empty."""
+        if not self.count:
+            return None
+        i = (self.next - 1) % self.size
+        return self.times[i], self.values[i]
+
+    def samples(self, since: Optional[float] = None) -> List[Tuple[float, float]]:
+        """Returns the raw (timestamp, value) samples held, oldest first."""
+        start = (self.next - self.count) % self.size
+        result = []
+        for n in range(self.count):
+            i = (start + n) % self.size
+            if since is None or self.times[i] >= since:
+                result.append((self.times[i], self.values[i]))
+        return result
+
+    def buckets(self, since: Optional[float] = None) -> List[Bucket]:
+        """Returns the downsampled (start, min, max, avg) buckets, oldest first."""
+        start = (self.bucket_next - self.buckets_used) % self.nbuckets
+        result = []
+        for n in range(self.buckets_used):
+            i = (start + n) % self.nbuckets
+            if since is None or self.bucket_start[i] + self.bucket_seconds > since:
+                result.append(
+                    (
+                        self.bucket_start[i],
+                        self.bucket_min[i],
+                        self.bucket_max[i],
+                        self.bucket_sum[i] / self.bucket_count[i],
+                    )
+                )
+        return result
+
+    def summary(self, since: Optional[float] = None) -> Optional[Tuple[float, ...]]:
+        """Returns (min, max, avg) of all held data, or None if there is none.
+
+        Buckets that overlap since are included in full.
+        """
+        low = high = None
+        total = 0.0
+        count = 0
+        for _, value in self.samples(since):
+            low = value if low is None else min(low, value)
+            high = value if high is None else max(high, value)
+            total += value
+            count += 1
+        startindex = (self.bucket_next - self.buckets_used) % self.nbuckets
+        for n in range(self.buckets_used):
+            i = (startindex + n) % self.nbuckets
+            if (
+                since is not None
+                and self.bucket_start[i] + self.bucket_seconds <= since
+            ):
+                continue
+            low = self.bucket_min[i] if low is None else min(low, self.bucket_min[i])
+            high = self.bucket_max[i] if high is None else max(high, self.bucket_max[i])
+            total += self.bucket_sum[i]
+            count += self.bucket_count[i]
+        if not count:
+            return None
+        return low, high, total / count
+
+
+class RollerTelemetry:
+    """The telemetry history of a roller."""
+
+    __slots__ = ("battery", "signal", "closed_percent")
+
+    def __init__(self, size: int = 256, buckets: int = 168, bucket_seconds=3600):
+        """Init the history, see TelemetrySeries for the arguments."""
+        self.battery = TelemetrySeries(size, buckets, bucket_seconds)
+        self.signal = TelemetrySeries(size, buckets, bucket_seconds)
+        self.closed_percent = TelemetrySeries(size, buckets, bucket_seconds)
+
+    def record(self, roller, timestamp: Optional[float] = None):
+        """Add the current values of roller that have changed, or are due."""
+        if timestamp is None:
+            timestamp = time.time()
+        for attr in self.__slots__:
+            value = getattr(roller, attr)
+            if value is None:
+                continue
+            series = getattr(self, attr)
+            latest = series.latest()
+            if (
+                latest is None
+                or latest[1] != value
+                or timestamp - latest[0] >= SAMPLE_INTERVAL
+            ):
+                series.add(value, timestamp)
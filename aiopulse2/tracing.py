@@ -0,0 +1,94 @@
+"""Opt in timing of the processing of each message received from a hub."""
+
+import logging
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds a message can take to process before a slow frame warning is logged, the
+# same as the asyncio debug mode slow callback duration
+SLOW_FRAME = 0.1
+
+
+class FrameTrace:
+    """The time taken by each stage of processing one message.
+
+    kind: "websocket" for a shadow frame, "serial" for a serial response
+    stages: seconds taken by each stage, by name, in the order first reached
+    total: seconds from start to finish, set once finished
+    """
+
+    __slots__ = ("kind", "host", "stages", "start", "last", "total", "token")
+
+    def __init__(self, kind: str, host: str):
+        """Init the trace, starting the clock."""
+        self.kind = kind
+        self.host = host
+        self.stages: Dict[str, float] = {}
+        self.start = self.last = time.perf_counter()
+        self.total: Optional[float] = None
+        self.token = None
+
+    def __repr__(self):
+        """Returns the string representation of the trace."""
+        stages = " ".join(f"{k}={v * 1000:.2f}ms" for k, v in self.stages.items())
+        return f"<FrameTrace {self.kind} {self.host} {stages}>"
+
+    def mark(self, stage: str):
+        """Add the time since the previous mark to stage."""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
+# The trace of the message being processed, the hub and roller callbacks started
+# while processing it (both coroutines and functions run in the executor) also see it
+current_trace: ContextVar[Optional[FrameTrace]] = ContextVar(
+    "aiopulse2_trace", default=None
+)
+
+
+class Tracer:
+    """Times the processing of the messages from hubs, see Hub(tracer=...).
+
+    callback: called with each finished FrameTrace, this is called directly from
+        the processing of the message, so should be quick
+    slow_frame: log a warning when a message takes longer than this many seconds,
+        None to disable
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[FrameTrace], None]] = None,
+        slow_frame: Optional[float] = SLOW_FRAME,
+    ):
+        """Init the tracer."""
+        self.callback = callback
+        self.slow_frame = slow_frame
+
+    def start(self, kind: str, host: str) -> FrameTrace:
+        """Returns a new trace, which is also set as the current_trace."""
+        trace = FrameTrace(kind, host)
+        trace.token = current_trace.set(trace)
+        return trace
+
+    def finish(self, trace: FrameTrace):
+        """Complete trace, sending it to the callback and checking for slow frames."""
+        trace.total = time.perf_counter() - trace.start
+        current_trace.reset(trace.token)
+        trace.token = None
+        if self.callback is not None:
+            try:
+                self.callback(trace)
+            except Exception:
+                _LOGGER.exception("Error in trace callback")
+        if self.slow_frame is not None and trace.total > self.slow_frame:
+            _LOGGER.warning(
+                "%s: Slow %s frame, took %.1f ms: %s",
+                trace.host,
+                trace.kind,
+                trace.total * 1000,
+                ", ".join(f"{k} {v * 1000:.1f} ms" for k, v in trace.stages.items()),
+            )
@@ -0,0 +1,211 @@
+"""Tracking of the commands sent to rollers, until acknowledged and complete."""
+
+import asyncio
+import time
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Optional, Tuple
+
+from .const import CommandStatus
+
+# Upper bounds, in seconds, of the latency histogram buckets, there is a final
+# bucket for anything above
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Commands not complete after this many seconds are expired
+COMMAND_EXPIRE_AFTER = 300
+
+
+class LatencyHistogram:
+    """Counts of latencies in fixed buckets, see LATENCY_BUCKETS."""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        """Init an empty histogram."""
+        self.counts = array(
+            "L", bytes(array("L").itemsize * (len(LATENCY_BUCKETS) + 1))
+        )
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Returns the histogram, buckets maps each upper bound to its count."""
+        bounds = LATENCY_BUCKETS + (float("inf"),)
+        return {
+            "buckets": dict(zip(bounds, self.counts)),
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "average": self.total / self.count if self.count else None,
+        }
+
+
+class TrackedCommand:
+    """A move or stop command sent to a roller.
+
+    id: assigned in order by the hub's tracker
+    percent: the target percent closed, None for a stop
+    status: the CommandStatus
+    sent, acked, completed: the time.monotonic() of each, or None
+    """
+
+    __slots__ = (
+        "id",
+        "rollerid",
+        "percent",
+        "start_percent",
+        "status",
+        "created",
+        "sent",
+        "acked",
+        "completed",
+        "done",
+    )
+
+    def __init__(
+        self,
+        commandid: int,
+        rollerid: str,
+        percent: Optional[int],
+        start_percent: Optional[int],
+    ):
+        """Init the command, before it is sent."""
+        self.id = commandid
+        self.rollerid = rollerid
+        self.percent = percent
+        self.start_percent = start_percent
+        self.status = CommandStatus.queued
+        self.created = time.monotonic()
+        self.sent: Optional[float] = None
+        self.acked: Optional[float] = None
+        self.completed: Optional[float] = None
+        # Resolves with the final status
+        self.done = asyncio.get_event_loop().create_future()
+
+    def __repr__(self):
+        """Returns the string representation of the command."""
+        return (
+            f"<TrackedCommand {self.id} {self.rollerid} to {self.percent} "
+            f"{self.status.name}>"
+        )
+
+    async def wait(self, timeout: Optional[float] = None) -> CommandStatus:
+        """Wait until the command is finished, returns the final status.
+
+        Raises asyncio.TimeoutError if not finished within timeout seconds.
+        """
+        return await asyncio.wait_for(asyncio.shield(self.done), timeout)
+
+    def finish(self, status: CommandStatus):
+        self.status = status
+        if not self.done.done():
+            self.done.set_result(status)
+
+
+class CommandTracker:
+    """The commands of one hub that are not finished, and their latencies.
+
+    A command is acknowledged by the first shadow after it was sent that has the
+    roller moving, or at a different position to when the command was made. It is
+    complete once a shadow has the roller stopped at the target, or stopped after
+    being acknowledged. A stop command is complete as soon as the roller is
+    reported stopped. A newer command for the roller supersedes an unfinished one.
+    """
+
+    def __init__(self):
+        """Init the tracker."""
+        self.next_id = 1
+        self.pending: Dict[str, TrackedCommand] = {}
+        self.ack_latency = LatencyHistogram()
+        self.complete_latency = LatencyHistogram()
+        self.roller_latency: Dict[str, Tuple[LatencyHistogram, LatencyHistogram]] = {}
+
+    def track(
+        self, rollerid: str, percent: Optional[int], start_percent: Optional[int]
+    ) -> TrackedCommand:
+        """Returns a new command for rollerid, call sent() once it is sent."""
+        command = TrackedCommand(self.next_id, rollerid, percent, start_percent)
+        self.next_id += 1
+        old = self.pending.get(rollerid)
+        if old is not None:
+            old.finish(CommandStatus.superseded)
+        self.pending[rollerid] = command
+        return command
+
+    def sent(self, command: TrackedCommand):
+        """Record that command has been sent."""
+        if command.status == CommandStatus.queued:
+            command.sent = time.monotonic()
+            command.status = CommandStatus.sent
+
+    def observe(self, rollerid: str, moving: bool, closed_percent: int):
+        """Update the command of rollerid from the values reported by the hub."""
+        command = self.pending.get(rollerid)
+        if command is None or command.sent is None:
+            return
+        now = time.monotonic()
+        if command.percent is None:
+            if not moving:
+                self.ack(command, now)
+                self.complete(command, now)
+            return
+        if command.acked is None:
+            if moving or closed_percent != command.start_percent:
+                self.ack(command, now)
+            elif closed_percent == command.percent:
+                # Already there, the roller won't move
+                self.ack(command, now)
+        if not moving and command.acked is not None:
+            self.complete(command, now)
+
+    def ack(self, command: TrackedCommand, now: float):
+        command.acked = now
+        command.status = CommandStatus.acked
+        latency = now - command.sent
+        self.ack_latency.record(latency)
+        self.histograms(command.rollerid)[0].record(latency)
+
+    def complete(self, command: TrackedCommand, now: float):
+        command.completed = now
+        latency = now - command.sent
+        self.complete_latency.record(latency)
+        self.histograms(command.rollerid)[1].record(latency)
+        del self.pending[command.rollerid]
+        command.finish(CommandStatus.completed)
+
+    def histograms(self, rollerid: str) -> Tuple[LatencyHistogram, LatencyHistogram]:
+        if rollerid not in self.roller_latency:
+            self.roller_latency[rollerid] = (LatencyHistogram(), LatencyHistogram())
+        return self.roller_latency[rollerid]
+
+    def expire(self, now: Optional[float] = None):
+        """Expire the commands that have not completed in COMMAND_EXPIRE_AFTER."""
+        if now is None:
+            now = time.monotonic()
+        for rollerid, command in list(self.pending.items()):
+            if now - command.created > COMMAND_EXPIRE_AFTER:
+                del self.pending[rollerid]
+                command.finish(CommandStatus.expired)
+
+    def latency(self, rollerid: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Returns the send to ack and send to complete latency histograms.
+
+        rollerid: the roller to return them for, default is the whole hub
+        """
+        if rollerid is None:
+            ack, complete = self.ack_latency, self.complete_latency
+        else:
+            ack, complete = self.histograms(rollerid)
+        return {"ack": ack.as_dict(), "complete": complete.as_dict()}
@@ -1,3 +1,4 @@
-python3 pulse_hub_cli.py '192.168.1.127' 'Office 1 of 3' 100
-python3 pulse_hub_cli.py '192.168.1.127' 'Office 2 of 3' 100
-python3 pulse_hub_cli.py '192.168.1.127' 'Office 3 of 3' 100
+python3 pulse_hub_cli.py --sequential \
+    '192.168.1.127' 'Office 1 of 3' 100 \
+    '192.168.1.127' 'Office 2 of 3' 100 \
+    '192.168.1.127' 'Office 3 of 3' 100
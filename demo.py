@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 """Demo."""
-import asyncio
+
 import cmd
-import functools
 import logging
 import json
-from typing import Any, Callable, Optional
+import shlex
 
 import aiopulse2
 from aiopulse2 import _LOGGER
@@ -14,58 +13,27 @@ from aiopulse2 import _LOGGER
 class HubPrompt(cmd.Cmd):
     """Prompt command line class based on cmd."""
 
-    def __init__(self, event_loop):
+    def __init__(self, client):
         """Init command interface."""
-        self.hubs = {}
-        self.event_loop = event_loop
-        self.running = True
+        self.client = client
+        self.hubs = client.hubs
+        self.group = client.group
         super().__init__()
 
-    def add_job(self, target: Callable[..., Any], *args: Any) -> None:
-        """Add job to the executor pool.
-
-        target: target to call.
-        args: parameters for method to call.
-        """
-        if target is None:
-            raise ValueError("Don't call add_job with None")
-        self.event_loop.call_soon_threadsafe(self.async_add_job, target, *args)
-
-    def async_add_job(
-        self, target: Callable[..., Any], *args: Any
-    ) -> Optional[asyncio.Future]:
-        """Add a job from within the event loop.
-
-        This method must be run in the event loop.
-
-        target: target to call.
-        args: parameters for method to call.
-        """
-        task = None
-
-        # Check for partials to properly determine if coroutine function
-        check_target = target
-        while isinstance(check_target, functools.partial):
-            check_target = check_target.func
-
-        if asyncio.iscoroutine(check_target):
-            task = self.event_loop.create_task(target)  # type: ignore
-        elif asyncio.iscoroutinefunction(check_target):
-            task = self.event_loop.create_task(target(*args))
-        else:
-            task = self.event_loop.run_in_executor(None, target, *args)  # type: ignore
-
-        return task
-
-    async def add_hub(self, hubip):
+    def add_hub(self, hubip):
         """Add a hub to the prompt."""
-        hub = aiopulse2.Hub(hubip)
-        self.hubs[hub.id] = hub
+        future = self.client.connect_future(hubip)
+        future.add_done_callback(self.hub_added)
+
+    def hub_added(self, future):
+        """Called once the hub has the rollers setup initially."""
+        if future.exception():
+            print(f"Unable to add hub: {future.exception()!r}")
+            return
+        hub = future.result()
         hub.callback_subscribe(self.hub_update_callback)
-        # Test we can connect OK first.
-        self.add_job(hub.run)
-        # Wait until we have the rollers setup initially
-        await hub.rollers_known.wait()
+        for roller in hub.rollers.values():
+            roller.callback_subscribe(self.roller_update_callback)
         print("Hub added to prompt")
 
     async def hub_update_callback(self, hub):
@@ -79,17 +47,23 @@ class HubPrompt(cmd.Cmd):
         print(f"Roller Updated: {roller}")
 
     def _get_roller(self, args):
-        """Return roller based on string argument."""
+        """Return roller and the remaining arguments based on string arguments."""
+        if args and not args[0].isdigit():
+            roller = self.group.get_roller(args[0])
+            if roller is None:
+                print("Unknown roller {!r}".format(args[0]))
+            return roller, args[1:]
         try:
             hub_id = int(args[0]) - 1
             roller_id = int(args[1]) - 1
-            return list(list(self.hubs.values())[hub_id].rollers.values())[roller_id]
+            hub = list(self.hubs.values())[hub_id]
+            return list(hub.rollers.values())[roller_id], args[2:]
         except Exception:
             print("Invalid arguments {}".format(args))
             print(
-                "Format is <hub index> <roller index>. See 'list' for the index of each device."
+                "Format is <hub index> <roller index> or <roller name>. See 'list' for the index of each device."
             )
-            return None
+            return None, args
 
     def do_list(self, args):
         """Command to list all hubs and rollers."""
@@ -106,54 +80,50 @@ class HubPrompt(cmd.Cmd):
     def do_moveto(self, sargs):
         """Command to tell a roller to move a % closed."""
         print("Sending move to")
-        args = sargs.split()
-        roller = self._get_roller(args)
+        roller, args = self._get_roller(shlex.split(sargs))
         if roller:
-            position = int(args[2])
+            position = int(args[0])
             print("Sending blind move to {}".format(roller.name))
-            self.add_job(roller.move_to, position)
+            self.client.move_to_future(roller, position)
 
     def do_close(self, sargs):
         """Command to close a roller."""
-        args = sargs.split()
-        roller = self._get_roller(args)
+        roller, _ = self._get_roller(shlex.split(sargs))
         if roller:
             print("Sending blind down to {}".format(roller.name))
-            self.add_job(roller.move_down)
+            self.client.move_to_future(roller, 100)
 
     def do_open(self, sargs):
         """Command to open a roller."""
-        args = sargs.split()
-        roller = self._get_roller(args)
+        roller, _ = self._get_roller(shlex.split(sargs))
         if roller:
             print("Sending blind up to {}".format(roller.name))
-            self.add_job(roller.move_up)
+            self.client.move_to_future(roller, 0)
 
     def do_stop(self, sargs):
         """Command to stop a moving roller."""
-        args = sargs.split()
-        roller = self._get_roller(args)
+        roller, _ = self._get_roller(shlex.split(sargs))
         if roller:
             print("Sending blind stop to {}".format(roller.name))
-            self.add_job(roller.move_stop)
+            self.client.move_stop_future(roller)
 
     def do_send(self, sargs):
         """Send a raw command to each hub."""
         jsargs = json.loads(sargs)
         for hub in self.hubs.values():
-            self.add_job(hub.send_payload, jsargs)
+            self.client.submit(hub.send_payload(jsargs))
 
     def do_connect(self, sargs):
         """Command to connect all hubs."""
         for hubip in sargs.split():
             print("Hub IP:", hubip)
             if hubip not in self.hubs:
-                self.add_job(self.add_hub, hubip)
+                self.add_hub(hubip)
 
     def do_disconnect(self, sargs):
         """Command to disconnect all connected hubs."""
-        for hub in self.hubs.values():
-            self.add_job(hub.stop)
+        for hubip in list(self.hubs):
+            self.client.submit(self.client.async_disconnect(hubip))
 
     def do_log(self, sargs):
         """Change logging level."""
@@ -178,25 +148,18 @@ class HubPrompt(cmd.Cmd):
     def do_exit(self, arg):
         """Command to exit."""
         print("Exiting")
-        self.running = False
-        for hub in self.hubs.values():
-            self.async_add_job(hub.stop())
+        self.client.close()
         return True
 
 
-async def main():
+def main():
     """Test code."""
-    event_loop = asyncio.get_running_loop()
-
-    prompt = HubPrompt(event_loop)
+    prompt = HubPrompt(aiopulse2.SyncClient())
     prompt.prompt = "> "
-
-    tasks = [event_loop.run_in_executor(None, prompt.cmdloop)]
-
-    await asyncio.wait(tasks)
+    prompt.cmdloop()
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     # logging.basicConfig(level=logging.DEBUG)
-    asyncio.run(main())
+    main()
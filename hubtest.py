@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 """Demo."""
+
 import asyncio
 import logging
 import sys
@@ -10,20 +11,22 @@ import aiopulse2
 async def main():
     hosts = sys.argv[1:]
     if not hosts:
-        print("Usage: hubtest.py host1 [host2 ...]")
+        print("Usage: hubtest.py host1|subnet1 [host2|subnet2 ...]")
+        print("    eg: hubtest.py 192.168.1.127 10.0.0.0/24")
         return
-    for host in hosts:
-        try:
-            hub = aiopulse2.Hub(host)
-            result = await hub.test(True)
-            if result:
-                print(f"Host: {host}: {hub}")
-                for roller in hub.rollers.values():
-                    print(f"    {roller}")
-            else:
-                print(f"Host: {host}: Unknown Error")
-        except Exception as e:
-            print(f"Host: {host}: Error ({e})")
+    subnets = [host for host in hosts if "/" in host]
+    hosts = [host for host in hosts if "/" not in host]
+    results = [aiopulse2.probe_hubs(hosts, update_devices=True)]
+    for subnet in subnets:
+        results.append(aiopulse2.scan_subnet(subnet, update_devices=True))
+    for probes in results:
+        async for host, hub, error in probes:
+            if error is not None:
+                print(f"Host: {host}: Error ({error!r})")
+                continue
+            print(f"Host: {host}: {hub}")
+            for roller in hub.rollers.values():
+                print(f"    {roller}")
 
 
 if __name__ == "__main__":
@@ -1,112 +1,337 @@
 #!/usr/bin/env python3
-"""cli utility"""
+"""cli utility
+
+Moves one or more rollers, given the hub ip, roller name and closed percent for
+each, or a scene file. If a daemon started with --daemon is listening on the
+socket, the moves are sent to it, which keeps the hub connections and roller
+state warm between runs. Otherwise the hubs are connected to directly for this run.
+"""
+
+import argparse
 import asyncio
-import functools
-from typing import Any, Callable, Optional
-import aiopulse2
+import json
+import os
+import signal
 import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 
-def add_job(event_loop, target: Callable[..., Any], *args: Any) -> None:
-    """Add job to the executor pool.
-    target: target to call.
-    args: parameters for method to call.
-    """
-    if target is None:
-        raise ValueError("Don't call add_job with None")
-    event_loop.call_soon_threadsafe(async_add_job, event_loop, target, *args)
-
-def async_add_job(
-    event_loop, target: Callable[..., Any], *args: Any
-) -> Optional[asyncio.Future]:
-    """Add a job from within the event loop.
-    This method must be run in the event loop.
-    target: target to call.
-    args: parameters for method to call.
+import aiopulse2
+
+# Seconds to wait for each step before giving up
+TIMEOUT = 20
+
+# A requested move: (hub_ip, roller_name, closed_percent)
+Move = Tuple[str, str, int]
+
+
+def default_socket_path() -> str:
+    """The socket the daemon listens on if not given with --socket."""
+    rundir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(rundir, f"pulse_hub_cli-{os.getuid()}.sock")
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="pulse_hub_cli.py",
+        description="Move roller blinds connected to Automate Pulse v2 hubs.",
+    )
+    parser.add_argument(
+        "moves",
+        nargs="*",
+        metavar="hub_ip roller_name closed_percent",
+        help="one or more rollers to move",
+    )
+    parser.add_argument(
+        "--scene",
+        help="a JSON or YAML file mapping each hub ip to {roller_name: closed_percent}",
+    )
+    parser.add_argument(
+        "--sequential",
+        action="store_true",
+        help="move one roller at a time, same as --max-concurrent 1",
+    )
+    parser.add_argument(
+        "--max-concurrent",
+        type=int,
+        default=0,
+        help="the most rollers moving at once, 0 (default) for no limit",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="run in the background keeping hub connections open for later runs",
+    )
+    parser.add_argument(
+        "--socket",
+        default=default_socket_path(),
+        help="the unix socket of the daemon (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="always connect to the hub directly, even if a daemon is running",
+    )
+    args = parser.parse_args(argv)
+    if args.max_concurrent < 0:
+        parser.error("--max-concurrent must be 0 or more")
+    if not args.daemon:
+        if len(args.moves) % 3:
+            parser.error("moves must be hub_ip roller_name closed_percent triples")
+        if not args.moves and not args.scene:
+            parser.error("hub_ip, roller_name and closed_percent are required")
+        for percent in args.moves[2::3]:
+            if not percent.isdigit():
+                parser.error(f"invalid closed_percent: {percent!r}")
+    if args.sequential:
+        args.max_concurrent = 1
+    return args
+
+
+def load_scene(path: str) -> List[Move]:
+    """Load the moves from a scene file, YAML is used unless it ends with .json."""
+    with open(path) as f:
+        if path.endswith(".json"):
+            scene = json.load(f)
+        else:
+            import yaml
+
+            scene = yaml.safe_load(f)
+    if not isinstance(scene, dict) or not all(
+        isinstance(rollers, (dict, type(None))) for rollers in scene.values()
+    ):
+        raise ValueError(f"{path}: the scene must map each hub ip to its rollers")
+    moves = [
+        (str(hubip), str(roller_name), int(percent))
+        for hubip, rollers in scene.items()
+        for roller_name, percent in (rollers or {}).items()
+    ]
+    if not moves:
+        raise ValueError(f"{path}: the scene has no rollers to move")
+    return moves
+
+
+def get_moves(args: argparse.Namespace, cwd: str) -> List[Move]:
+    """All of the moves requested, scene files are relative to cwd."""
+    moves = [
+        (hubip, roller_name, int(percent))
+        for hubip, roller_name, percent in zip(*[iter(args.moves)] * 3)
+    ]
+    if args.scene:
+        moves.extend(load_scene(os.path.join(cwd, args.scene)))
+    return moves
+
+
+class HubCache:
+    """The connected hubs, by IP, started on first use."""
+
+    def __init__(self):
+        self.hubs: Dict[str, aiopulse2.Hub] = {}
+        self.starting: Dict[str, asyncio.Future] = {}
+
+    async def get_hub(self, hubip: str, out: Callable[[str], None]) -> aiopulse2.Hub:
+        if hubip not in self.starting:
+            self.starting[hubip] = asyncio.ensure_future(self.start_hub(hubip, out))
+        try:
+            return await asyncio.shield(self.starting[hubip])
+        except asyncio.TimeoutError:
+            # Start afresh next time
+            self.starting.pop(hubip, None)
+            raise
+
+    async def start_hub(self, hubip: str, out: Callable[[str], None]):
+        out(f"  setup the hub {hubip}")
+        hub = aiopulse2.Hub(hubip)
+        self.hubs[hubip] = hub
+        asyncio.create_task(hub.run())
+        try:
+            await asyncio.wait_for(hub.rollers_known.wait(), TIMEOUT)
+        except asyncio.TimeoutError:
+            del self.hubs[hubip]
+            await hub.stop()
+            raise
+        return hub
+
+    async def close(self, out: Callable[[str], None]):
+        for hub in self.hubs.values():
+            out(f"  close the connection to {hub.host}")
+            await hub.stop()
+        self.hubs.clear()
+        self.starting.clear()
+
+
+async def wait_for(test: Callable[[], bool], interval: float = 0.1) -> bool:
+    """Wait until test() returns True, returns False after TIMEOUT."""
+    for _ in range(int(TIMEOUT / interval)):
+        if test():
+            return True
+        await asyncio.sleep(interval)
+    return test()
+
+
+async def find_roller(
+    hubs: HubCache, move: Move, out: Callable[[str], None]
+) -> Optional[aiopulse2.Roller]:
+    """Find the roller for the move, ready to be moved, or None on error."""
+    hubip, desired_roller_name, _ = move
+    try:
+        hub = await hubs.get_hub(hubip, out)
+    except asyncio.TimeoutError:
+        out(f"  failed to connect to hub {hubip}")
+        return None
+
+    try:
+        # hub.rollers gets populated while waiting sometimes
+        roller = await hub.wait_for_roller(desired_roller_name, TIMEOUT)
+    except asyncio.TimeoutError:
+        out(f"  failed to find roller {desired_roller_name}")
+        return None
+
+    if not await wait_for(lambda: roller.closed_percent is not None, 0.5):
+        out(f"   roller {roller.name} has not reported")
+        return None
+    return roller
+
+
+async def wait_arrival(
+    roller: aiopulse2.Roller, desired_closed_percent: int, out: Callable[[str], None]
+) -> bool:
+    """Wait for roller to arrive at desired_closed_percent, False on timeout."""
+    # to-do - rounding error can cause this e.g. a roller looking for 27 to finish
+    # at 26
+    if not await wait_for(lambda: roller.closed_percent == desired_closed_percent):
+        out(
+            f"  timeout - roller {roller.name} has not yet arrived at "
+            f"{desired_closed_percent} - {roller.closed_percent}"
+        )
+        return False
+    return True
+
+
+async def run_group(
+    hubs: HubCache, moves: List[Move], out: Callable[[str], None]
+) -> List[Tuple[Move, bool, float]]:
+    """Move the rollers together, with one combined command per hub
+
+    Returns (move, success, seconds taken) for each move.
     """
-    task = None
-    # Check for partials to properly determine if coroutine function
-    check_target = target
-    while isinstance(check_target, functools.partial):
-        check_target = check_target.func
-    if asyncio.iscoroutine(check_target):
-        task = event_loop.create_task(target)  # type: ignore
-    elif asyncio.iscoroutinefunction(check_target):
-        task = event_loop.create_task(target(*args))
-    else:
-        task = event_loop.run_in_executor(None, target, *args)  # type: ignore
-    return task
-
-async def close_up(event_loop, hub):
-  print(f"  close the connection")
-  add_job(event_loop, hub.stop)
-
-  print(f"  wait for the connection to close")
-  while(hub.running):
-    await asyncio.sleep(0.5)
+    start = time.monotonic()
+    rollers = await asyncio.gather(*(find_roller(hubs, move, out) for move in moves))
+    byhub: Dict[aiopulse2.Hub, Dict[str, int]] = {}
+    for move, roller in zip(moves, rollers):
+        if roller is not None:
+            out(f" move hub {move[0]} roller {move[1]} to closed {move[2]}%")
+            byhub.setdefault(roller.hub, {})[roller.id] = move[2]
+    await asyncio.gather(
+        *(hub.move_many(positions) for hub, positions in byhub.items())
+    )
+
+    async def arrival(move, roller):
+        if roller is None:
+            return move, False, time.monotonic() - start
+        success = await wait_arrival(roller, move[2], out)
+        return move, success, time.monotonic() - start
+
+    return await asyncio.gather(*(arrival(m, r) for m, r in zip(moves, rollers)))
+
+
+async def run_command(
+    hubs: HubCache, args: argparse.Namespace, cwd: str, out: Callable[[str], None]
+) -> int:
+    """Run the command line, returns the exit status."""
+    try:
+        moves = get_moves(args, cwd)
+    except ValueError as e:
+        out(f"error: {e}")
+        return 2
+    groupsize = args.max_concurrent or len(moves)
+    results = []
+    for i in range(0, len(moves), groupsize):
+        results.extend(await run_group(hubs, moves[i : i + groupsize], out))
+
+    if len(results) > 1:
+        out(" summary:")
+        for (hubip, roller_name, percent), success, seconds in results:
+            status = "ok" if success else "FAILED"
+            out(f"  {status:6} {hubip} {roller_name} {percent}% {seconds:.1f}s")
+    return 0 if all(success for _, success, _ in results) else 1
+
+
+async def run_daemon(socket_path: str):
+    """Listen on socket_path for commands until terminated."""
+    hubs = HubCache()
+
+    async def handle_client(reader, writer):
+        def out(line):
+            writer.write(json.dumps({"out": line}).encode() + b"\n")
+
+        try:
+            request = json.loads(await reader.readline())
+            args = parse_args(request["argv"])
+            status = await run_command(hubs, args, request["cwd"], out)
+        except SystemExit as e:
+            # argparse errors
+            status = e.code
+        except Exception as e:
+            out(f"  error: {e!r}")
+            status = 1
+        writer.write(json.dumps({"exit": status}).encode() + b"\n")
+        await writer.drain()
+        writer.close()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(handle_client, socket_path)
+    os.chmod(socket_path, 0o600)
+    print(f"listening on {socket_path}")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    async with server:
+        await stop.wait()
+    os.unlink(socket_path)
+    await hubs.close(print)
+
+
+async def run_client(socket_path: str, argv: List[str]) -> Optional[int]:
+    """Send argv to the daemon, returns the exit status or None if not running."""
+    try:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    except OSError:
+        return None
+    writer.write(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode() + b"\n")
+    await writer.drain()
+    status = 1
+    async for line in reader:
+        response = json.loads(line)
+        if "out" in response:
+            print(response["out"])
+        else:
+            status = response["exit"]
+    writer.close()
+    return status
+
 
 async def main():
-  """cli utility"""
-
-  if(len(sys.argv) != 4):
-    print(f"usage: pulse_hub_cli.py hub_ip roller_name closed_percent")
-    exit(1)
-
-  hubip=sys.argv[1]
-  desired_roller_name = sys.argv[2]
-  desired_closed_percent = int(sys.argv[3])
-
- # hubip='192.168.1.127'
- # desired_roller_name = 'Office 3 of 3'
- # desired_closed_percent = 26 # 26 (27 for 1 of 3) closed percent is the desired location
-
-  print(f" move hub {hubip} roller {desired_roller_name} to closed {desired_closed_percent}%")
-
-  event_loop = asyncio.get_running_loop()
-
-  print("  setup the hub")
-  hub = aiopulse2.Hub(hubip)
-  add_job(event_loop, hub.run)
-  await hub.rollers_known.wait()
-
-  print("  find the roller")
-  counter=0
-  roller = list(hub.rollers.values())[0]
-  while(roller.name!=desired_roller_name):  # hub.rollers gets populated while this loop runs sometimes
-    for roller in hub.rollers.values():
-      if(roller.name==desired_roller_name):
-        break
-    if(roller.name!=desired_roller_name):
-      counter+=1
-      if(counter>200): # timeout after 20 seconds
-        print(f"  failed to find roller {desired_roller_name}")
-        await close_up(event_loop, hub)
-        exit(1)
-      await asyncio.sleep(0.5)
-
-  print("  ensure the roller is all set")
-  counter=0
-  while(roller.closed_percent==None):
-    counter+=1
-    if(counter>200): # timeout after 20 seconds
-      print(f"   roller {roller.name} has not reported")
-      await close_up(event_loop, hub)
-      exit(1)
-    await asyncio.sleep(0.5)
-
-  print('  send moveto command')
-  add_job(event_loop, roller.move_to, desired_closed_percent)
-
-  print(f"  wait for the roller to arrive at {desired_closed_percent}")
-  counter=0
-  while(roller.closed_percent != desired_closed_percent):
-    counter+=1
-    if(counter>200): # timeout after 20 seconds - to-do - rounding error can cause this e.g. a roller looking for 27 to finish at 26
-      print(f"  timeout - roller has not yet arrived at {desired_closed_percent} - {roller.closed_percent}")
-      await close_up(event_loop, hub)
-      exit(1)
-    await asyncio.sleep(0.1)
-
-  await close_up(event_loop, hub)
+    """cli utility"""
+    args = parse_args(sys.argv[1:])
+    if args.daemon:
+        await run_daemon(args.socket)
+        return 0
+
+    if not args.no_daemon:
+        status = await run_client(args.socket, sys.argv[1:])
+        if status is not None:
+            return status
+
+    hubs = HubCache()
+    try:
+        return await run_command(hubs, args, os.getcwd(), print)
+    finally:
+        await hubs.close(print)
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    sys.exit(asyncio.run(main()))
@@ -16,7 +16,7 @@ setuptools.setup(
     url="https://github.com/sillyfrog/aiopulse2",
     download_url="https://github.com/sillyfrog/aiopulse2/archive/v1.0.0.tar.gz",
     keywords=["automation"],
-    install_requires=["async_timeout>=3.0", "websockets>=10.1"],
+    install_requires=["websockets>=10.1"],
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Intended Audience :: Developers",
@@ -0,0 +1,66 @@
+"""Import time budget of the package, see python -X importtime."""
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The most the cumulative import of aiopulse2 may take, in milliseconds, override
+# with AIOPULSE2_IMPORT_BUDGET_MS on slow machines
+IMPORT_BUDGET_MS = float(os.environ.get("AIOPULSE2_IMPORT_BUDGET_MS", 80))
+
+# Modules that must only be imported when first used
+LAZY_MODULES = ("websockets", "multiprocessing", "ipaddress", "aiopulse2.sharding")
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def import_time_ms() -> float:
+    """Returns the cumulative time to import aiopulse2 in a fresh interpreter."""
+    result = run_python("-X", "importtime", "-c", "import aiopulse2")
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "aiopulse2":
+            return int(fields[1]) / 1000
+    raise AssertionError(f"aiopulse2 not in the importtime output:\n{result.stderr}")
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_import_time(self):
+        # The first import may need to write the byte code, take the best of a few
+        best = min(import_time_ms() for _ in range(3))
+        self.assertLess(best, IMPORT_BUDGET_MS)
+
+    def test_lazy_modules(self):
+        result = run_python(
+            "-c",
+            "import sys, aiopulse2; "
+            f"print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))",
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+    def test_lazy_attributes(self):
+        result = run_python(
+            "-c",
+            "import aiopulse2, aiopulse2.devices; "
+            "print(aiopulse2.SyncClient.__name__, aiopulse2.probe_hubs.__name__, "
+            "aiopulse2.devices.ssl_context is aiopulse2.devices.get_ssl_context())",
+        )
+        self.assertEqual(result.stdout.split(), ["SyncClient", "probe_hubs", "True"])
+
+
+if __name__ == "__main__":
+    unittest.main()
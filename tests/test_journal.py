@@ -0,0 +1,100 @@
+"""Tests of restoring and reconciling the state journal."""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from aiopulse2 import Hub
+from aiopulse2.journal import RECORD_ACK, RECORD_COMMAND, RECORD_ROLLER, StateJournal
+
+
+class JournalTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "hub.journal")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_records(self, *records):
+        with open(self.path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    def make_hub(self):
+        hub = Hub("127.0.0.1", journal=StateJournal(self.path))
+        self.resent = []
+        hub.async_add_job = lambda target, *args: self.resent.append(
+            (target.__self__.id, *args)
+        )
+        self.addCleanup(hub.journal.close)
+        return hub
+
+    async def test_restore(self):
+        self.write_records(
+            {
+                "k": RECORD_ROLLER,
+                "r": "ABC",
+                "v": {"name": "Den", "closed_percent": 10},
+            },
+            {"k": RECORD_COMMAND, "n": 1, "r": "ABC", "p": 40, "t": time.time()},
+            {"k": RECORD_COMMAND, "n": 2, "r": "DEF", "p": 50, "t": time.time()},
+            {"k": RECORD_ACK, "n": 2, "r": "DEF"},
+        )
+        hub = self.make_hub()
+        self.assertEqual(hub.rollers["ABC"].name, "Den")
+        self.assertEqual(hub.rollers["ABC"].closed_percent, 10)
+        self.assertEqual(list(hub.journal.pending), ["ABC"])
+        self.assertEqual(hub.journal.restored, hub.journal.pending)
+        self.assertEqual(hub.journal.next_command, 3)
+
+    async def test_reconcile_resends_restored(self):
+        self.write_records(
+            {"k": RECORD_ROLLER, "r": "ABC", "v": {"closed_percent": 10}},
+            {"k": RECORD_ROLLER, "r": "DEF", "v": {"closed_percent": 50}},
+            {"k": RECORD_COMMAND, "n": 1, "r": "ABC", "p": 40, "t": time.time()},
+            {"k": RECORD_COMMAND, "n": 2, "r": "DEF", "p": 50, "t": time.time()},
+            {"k": RECORD_COMMAND, "n": 3, "r": "GHI", "p": 0, "t": time.time() - 600},
+            {"k": RECORD_ROLLER, "r": "GHI", "v": {"closed_percent": 100}},
+        )
+        hub = self.make_hub()
+        hub.journal.reconcile(hub)
+        # DEF is already there, GHI's move is too old
+        self.assertEqual(self.resent, [("ABC", 40)])
+        self.assertEqual(hub.journal.pending, {})
+        self.assertEqual(hub.journal.restored, {})
+
+    async def test_reconcile_ignores_new_moves(self):
+        self.write_records(
+            {"k": RECORD_ROLLER, "r": "ABC", "v": {"closed_percent": 10}}
+        )
+        hub = self.make_hub()
+        self.assertEqual(hub.journal.restored, {})
+        hub.journal.record_command("ABC", 44)
+        hub.journal.reconcile(hub)
+        self.assertEqual(self.resent, [])
+        self.assertIn("ABC", hub.journal.pending)
+
+    async def test_reconcile_skips_replaced_moves(self):
+        self.write_records(
+            {"k": RECORD_ROLLER, "r": "ABC", "v": {"closed_percent": 10}},
+            {"k": RECORD_COMMAND, "n": 1, "r": "ABC", "p": 40, "t": time.time()},
+        )
+        hub = self.make_hub()
+        hub.journal.record_command("ABC", 44)
+        hub.journal.reconcile(hub)
+        self.assertEqual(self.resent, [])
+        self.assertEqual(hub.journal.pending["ABC"][1], 44)
+
+    async def test_shared_journal(self):
+        journal = StateJournal(self.path)
+        Hub("127.0.0.1", journal=journal)
+        self.addCleanup(journal.close)
+        with self.assertRaises(ValueError):
+            Hub("127.0.0.2", journal=journal)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Tests of the command rate limiter, with a fake send and a short rate."""
+
+import asyncio
+import time
+import unittest
+
+from aiopulse2.ratelimit import CommandLimiter
+
+# Commands per second, short enough for the tests to run quickly
+RATE = 50
+
+
+class CommandLimiterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.sends = []
+
+    def send(self, name):
+        async def send():
+            self.sends.append((name, time.monotonic()))
+            return name
+
+        return send
+
+    async def submit_all(self, limiter, commands):
+        """Submit (key, name) commands in order, returns the result of each."""
+        tasks = [
+            asyncio.create_task(limiter.submit(key, self.send(name)))
+            for key, name in commands
+        ]
+        return await asyncio.gather(*tasks)
+
+    async def test_burst(self):
+        limiter = CommandLimiter(RATE, burst=3)
+        results = await self.submit_all(
+            limiter, [("a", "a1"), ("b", "b1"), ("a", "a2")]
+        )
+        self.assertEqual(results, ["a1", "b1", "a2"])
+        self.assertEqual(limiter.metrics()["delayed"], 0)
+        self.assertEqual(limiter.metrics()["max_delay"], 0.0)
+
+    async def test_merge_and_fairness(self):
+        limiter = CommandLimiter(RATE, burst=1)
+        start = time.monotonic()
+        results = await self.submit_all(
+            limiter, [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("a", "a4")],
+        )
+        # a1 uses the burst, then each waiting key is sent once in the order first
+        # queued, with its latest command, b isn't held up by the busy a
+        self.assertEqual([name for name, _ in self.sends], ["a1", "a4", "b1"])
+        # Every merged caller gets the result of the command that was sent
+        self.assertEqual(results, ["a1", "a4", "a4", "b1", "a4"])
+        # Sent at the rate once the burst is used up
+        times = [sent for _, sent in self.sends]
+        self.assertGreaterEqual(times[1] - start, 0.8 / RATE)
+        self.assertGreaterEqual(times[2] - times[1], 0.8 / RATE)
+
+        metrics = limiter.metrics()
+        self.assertEqual(metrics["sent"], 3)
+        self.assertEqual(metrics["delayed"], 4)
+        self.assertEqual(metrics["merged"], 2)
+        self.assertEqual(metrics["depth"], 0)
+        self.assertGreater(metrics["max_delay"], 0.0)
+        self.assertLessEqual(metrics["last_delay"], metrics["max_delay"])
+        self.assertAlmostEqual(
+            metrics["average_delay"], limiter.total_delay / 3, places=6
+        )
+
+    async def test_refill(self):
+        limiter = CommandLimiter(RATE, burst=2)
+        await self.submit_all(limiter, [("a", "a1"), ("b", "b1")])
+        self.assertLess(limiter.tokens, 1)
+        await asyncio.sleep(2 / RATE)
+        limiter.refill()
+        self.assertGreaterEqual(limiter.tokens, 1)
+        # Never more than the burst
+        await asyncio.sleep(3 / RATE)
+        limiter.refill()
+        self.assertEqual(limiter.tokens, 2)
+
+    async def test_error(self):
+        limiter = CommandLimiter(RATE, burst=1)
+
+        async def fail():
+            raise OSError("failed")
+
+        await limiter.submit("a", self.send("a1"))
+        waiters = [
+            asyncio.create_task(limiter.submit("a", fail)),
+            asyncio.create_task(limiter.submit("a", fail)),
+        ]
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        self.assertEqual([type(result) for result in results], [OSError, OSError])
+
+    async def test_cancelled(self):
+        limiter = CommandLimiter(RATE, burst=1)
+        await limiter.submit("a", self.send("a1"))
+        cancelled = asyncio.create_task(limiter.submit("b", self.send("b1")))
+        waiter = asyncio.create_task(limiter.submit("c", self.send("c1")))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        self.assertEqual(await waiter, "c1")
+        # The command nobody was waiting for was not sent
+        self.assertEqual([name for name, _ in self.sends], ["a1", "c1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Memory per roller and shadow apply time budgets, for sites with many rollers."""
+
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+import unittest
+
+from aiopulse2 import Hub
+from aiopulse2.devices import Roller
+
+# The number of rollers in the shadow, the largest sites have a few thousand
+ROLLERS = 2000
+
+# The most memory the hub may use for each roller once populated from a shadow
+# (the Roller, its id, position, indexes and health), in bytes, and the most a full
+# shadow may take to apply, in milliseconds. Override with
+# AIOPULSE2_ROLLER_BYTES_BUDGET and AIOPULSE2_SHADOW_APPLY_BUDGET_MS on slow machines
+ROLLER_BYTES_BUDGET = float(os.environ.get("AIOPULSE2_ROLLER_BYTES_BUDGET", 720))
+SHADOW_APPLY_BUDGET_MS = float(os.environ.get("AIOPULSE2_SHADOW_APPLY_BUDGET_MS", 25))
+
+
+def shadow_frame(offset: int = 0) -> str:
+    """Returns a full shadow with ROLLERS shades, offset changes the positions."""
+    shades = {
+        f"{i:03X}": {
+            "rs": -60,
+            "is": True,
+            "ol": True,
+            "mp": (i + offset) % 100,
+            "vo": "12.1D22",
+        }
+        for i in range(ROLLERS)
+    }
+    return json.dumps({"result": {"reported": {"name": "Hub", "shades": shades}}})
+
+
+async def roller_bytes() -> float:
+    """Returns the memory the hub uses for each roller, populated from a shadow."""
+    frame = shadow_frame()
+    hub = Hub("127.0.0.1")
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        await hub.wsconsumer(frame)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    hub.stop_serial()
+    return sum(stat.size_diff for stat in after.compare_to(before, "lineno")) / ROLLERS
+
+
+async def shadow_apply_ms(runs: int = 10) -> float:
+    """Returns the best time to apply a full shadow that moves every roller."""
+    frames = [shadow_frame(), shadow_frame(1)]
+    hub = Hub("127.0.0.1")
+    await hub.wsconsumer(frames[0])
+    best = float("inf")
+    for run in range(runs):
+        start = time.perf_counter()
+        await hub.wsconsumer(frames[(run + 1) % 2])
+        best = min(best, time.perf_counter() - start)
+    hub.stop_serial()
+    return best * 1000
+
+
+async def new_roller() -> Roller:
+    return Roller(Hub("127.0.0.1"), "ABC")
+
+
+# Run without the asyncio debug mode of IsolatedAsyncioTestCase, which adds to the
+# memory and time measured
+class RollerBudgetTest(unittest.TestCase):
+    def test_slots(self):
+        self.assertFalse(hasattr(asyncio.run(new_roller()), "__dict__"))
+
+    def test_roller_bytes(self):
+        used = asyncio.run(roller_bytes())
+        self.assertLess(used, ROLLER_BYTES_BUDGET, f"{used:.0f} bytes per roller")
+
+    def test_shadow_apply(self):
+        took = asyncio.run(shadow_apply_ms())
+        self.assertLess(took, SHADOW_APPLY_BUDGET_MS, f"{took:.1f} ms to apply")
+
+
+if __name__ == "__main__":
+    print(f"{asyncio.run(roller_bytes()):.0f} bytes per roller")
+    print(f"{asyncio.run(shadow_apply_ms()):.1f} ms per {ROLLERS} roller shadow")
@@ -0,0 +1,54 @@
+"""Tests of tracing the processing of hub messages."""
+
+import asyncio
+import json
+import unittest
+
+from aiopulse2 import Hub
+from aiopulse2.tracing import Tracer, current_trace
+
+SHADOW = json.dumps(
+    {
+        "result": {
+            "reported": {
+                "name": "Hub",
+                "shades": {"ABC": {"rs": -60, "is": True, "mp": 10, "vo": "12.1D22"}},
+            }
+        }
+    }
+)
+
+
+class TracingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_callbacks_see_trace(self):
+        traces = []
+        hub = Hub("127.0.0.1", delay_callbacks=False, tracer=Tracer(traces.append))
+        seen = {}
+
+        def sync_callback(hub):
+            seen["sync"] = current_trace.get()
+
+        async def async_callback(hub):
+            seen["async"] = current_trace.get()
+
+        hub.callback_subscribe(sync_callback)
+        hub.callback_subscribe(async_callback)
+        await hub.wsconsumer(SHADOW)
+        hub.stop_serial()
+        # Let the callbacks run, the executor in another thread
+        for _ in range(100):
+            if len(seen) == 2:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(len(traces), 1)
+        self.assertIs(seen.get("sync"), traces[0])
+        self.assertIs(seen.get("async"), traces[0])
+        self.assertIsNone(current_trace.get())
+        self.assertEqual(
+            list(traces[0].stages)[:4], ["decode", "hub", "shades", "callbacks"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
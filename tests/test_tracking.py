@@ -0,0 +1,126 @@
+"""Tests of the command tracker, driven by synthetic roller updates."""
+
+import unittest
+
+from aiopulse2.const import CommandStatus
+from aiopulse2.tracking import (
+    COMMAND_EXPIRE_AFTER,
+    LATENCY_BUCKETS,
+    CommandTracker,
+    LatencyHistogram,
+)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_record(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.05, 0.1, 0.3, 1000):
+            histogram.record(seconds)
+        result = histogram.as_dict()
+        self.assertEqual(result["count"], 4)
+        self.assertEqual(result["min"], 0.05)
+        self.assertEqual(result["max"], 1000)
+        self.assertAlmostEqual(result["average"], 1000.45 / 4)
+        # The bounds are inclusive, with a final bucket for anything above
+        self.assertEqual(result["buckets"][0.1], 2)
+        self.assertEqual(result["buckets"][0.5], 1)
+        self.assertEqual(result["buckets"][float("inf")], 1)
+        self.assertEqual(len(result["buckets"]), len(LATENCY_BUCKETS) + 1)
+
+    def test_empty(self):
+        result = LatencyHistogram().as_dict()
+        self.assertEqual(result["count"], 0)
+        self.assertIsNone(result["average"])
+        self.assertEqual(sum(result["buckets"].values()), 0)
+
+
+class CommandTrackerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tracker = CommandTracker()
+
+    def sent(self, rollerid, percent, start_percent):
+        command = self.tracker.track(rollerid, percent, start_percent)
+        self.tracker.sent(command)
+        return command
+
+    async def test_moving_then_stopped(self):
+        command = self.sent("ABC", 50, 0)
+        self.assertEqual(command.status, CommandStatus.sent)
+        # Not moving yet, at the start position
+        self.tracker.observe("ABC", False, 0)
+        self.assertEqual(command.status, CommandStatus.sent)
+        self.tracker.observe("ABC", True, 10)
+        self.assertEqual(command.status, CommandStatus.acked)
+        self.tracker.observe("ABC", True, 40)
+        self.assertIsNone(command.completed)
+        self.tracker.observe("ABC", False, 50)
+        self.assertEqual(await command.wait(1), CommandStatus.completed)
+        self.assertLessEqual(command.sent, command.acked)
+        self.assertLessEqual(command.acked, command.completed)
+        self.assertNotIn("ABC", self.tracker.pending)
+        latency = self.tracker.latency()
+        self.assertEqual(latency["ack"]["count"], 1)
+        self.assertEqual(latency["complete"]["count"], 1)
+        self.assertEqual(self.tracker.latency("ABC"), latency)
+        self.assertEqual(self.tracker.latency("DEF")["ack"]["count"], 0)
+
+    async def test_stopped_elsewhere(self):
+        # Stopped short of the target (such as an obstruction), after moving
+        command = self.sent("ABC", 50, 0)
+        self.tracker.observe("ABC", False, 20)
+        self.assertEqual(command.status, CommandStatus.completed)
+
+    async def test_already_at_target(self):
+        command = self.sent("ABC", 50, 50)
+        self.tracker.observe("ABC", False, 50)
+        self.assertEqual(command.status, CommandStatus.completed)
+        self.assertEqual(command.acked, command.completed)
+
+    async def test_not_sent(self):
+        command = self.tracker.track("ABC", 50, 0)
+        self.tracker.observe("ABC", True, 10)
+        self.tracker.observe("ABC", False, 50)
+        self.assertEqual(command.status, CommandStatus.queued)
+        self.assertIn("ABC", self.tracker.pending)
+
+    async def test_stop(self):
+        command = self.sent("ABC", None, 30)
+        self.tracker.observe("ABC", True, 35)
+        self.assertEqual(command.status, CommandStatus.sent)
+        self.tracker.observe("ABC", False, 40)
+        self.assertEqual(await command.wait(1), CommandStatus.completed)
+        self.assertEqual(self.tracker.latency()["complete"]["count"], 1)
+
+    async def test_superseded(self):
+        first = self.sent("ABC", 50, 0)
+        self.tracker.observe("ABC", True, 10)
+        second = self.sent("ABC", 80, 10)
+        self.assertEqual(await first.wait(1), CommandStatus.superseded)
+        self.assertIs(self.tracker.pending["ABC"], second)
+        self.assertEqual(second.id, first.id + 1)
+        # Superseding one roller's command doesn't affect another roller
+        other = self.sent("DEF", 20, 0)
+        self.tracker.observe("ABC", True, 30)
+        self.tracker.observe("ABC", False, 80)
+        self.assertEqual(second.status, CommandStatus.completed)
+        self.assertEqual(other.status, CommandStatus.sent)
+        # Only the acknowledgement of the first command is in the histograms
+        self.assertEqual(self.tracker.latency()["ack"]["count"], 2)
+        self.assertEqual(self.tracker.latency()["complete"]["count"], 1)
+
+    async def test_expired(self):
+        old = self.sent("ABC", 50, 0)
+        new = self.sent("DEF", 50, 0)
+        new.created = old.created + 10
+        self.tracker.expire(old.created + COMMAND_EXPIRE_AFTER + 1)
+        self.assertEqual(await old.wait(1), CommandStatus.expired)
+        self.assertEqual(list(self.tracker.pending), ["DEF"])
+        self.assertEqual(new.status, CommandStatus.sent)
+        # A late update for the expired command is ignored
+        self.tracker.observe("ABC", False, 50)
+        self.assertEqual(old.status, CommandStatus.expired)
+        self.assertEqual(self.tracker.latency()["complete"]["count"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()